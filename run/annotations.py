@@ -0,0 +1,41 @@
+
+import cv2
+
+class FrameAnnotations:
+    """
+    Overlay primitives recorded for one frame, kept apart from its pixels.
+
+    Detection code records rectangles and labels here instead of drawing them,
+    so crops taken from the frame stay clean. The overlay is only rasterized
+    with draw, once nothing reads the source pixels any more.
+    """
+    def __init__(self):
+        self.primitives = []
+
+    def rectangle(self, pt1, pt2, color, thickness=2):
+        self.primitives.append(('rectangle', (pt1, pt2, color, thickness)))
+
+    def text(self, text, org, color, font_scale=0.5, thickness=1):
+        self.primitives.append(('text', (text, org, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)))
+
+    def labeled_box(self, bbox, label, color):
+        """
+        Records a box with a label above its top-left corner.
+        """
+        x1, y1, x2, y2 = (int(v) for v in bbox)
+        self.rectangle((x1, y1), (x2, y2), color)
+        self.text(label, (x1, y1 - 10), color)
+
+    def draw(self, image):
+        """
+        Rasterizes the recorded primitives onto image in place and returns it.
+        """
+        for kind, args in self.primitives:
+            if kind == 'rectangle':
+                cv2.rectangle(image, *args)
+            else:
+                cv2.putText(image, *args)
+        return image
+
+    def __len__(self):
+        return len(self.primitives)
@@ -0,0 +1,193 @@
+
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+from detector import detect_and_track
+from data_processor import process_missing_data
+from visualizer import generate_video
+from pipeline import run_fused_pipeline
+from sharding import detect_and_track_sharded
+from models import init_worker, worker_session
+from sort.sort import KalmanBoxTracker
+from timing import timer
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+
+def process_video(video_path, output_folder, session, batch_size=1, threaded=False, ocr_workers=2, plate_roi=False,
+                  roi_size=320, schedule_ocr=False, preview_every=1, crop_keep=0, crop_archive=False,
+                  crop_shard_size=0, results_format='csv', max_gap=0, render_workers=1, fused_pipeline=False,
+                  window_size=30, detect_shards=1, shard_overlap=30, ocr_server=None, max_stride=1,
+                  min_changed=0.001, checkpoint_every=0, resume=False):
+    """
+    Runs detection, data processing and visualization for one video into output_folder.
+
+    The options are the configuration variables of main.py. Per-stage timings
+    are written to run_report.json next to the raw results (see timing.StageTimer).
+    """
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # Track IDs start at 1 for every video
+    KalmanBoxTracker.count = 0
+    timer.reset()
+    start = time.perf_counter()
+
+    # Define output file paths
+    raw_csv_path = os.path.join(output_folder, f'raw_results.{results_format}')
+    processed_csv_path = os.path.join(output_folder, f'processed_results.{results_format}')
+    output_video_path = os.path.join(output_folder, 'output_video.mp4')
+    vehicle_output_folder = os.path.join(output_folder, 'detected_vehicles')
+    plate_output_folder = os.path.join(output_folder, 'detected_plates')
+
+    if fused_pipeline:
+        print("Running fused detection, processing and visualization pipeline...")
+        run_fused_pipeline(video_path, raw_csv_path, processed_csv_path, output_video_path,
+                           vehicle_output_folder, plate_output_folder, window_size=window_size,
+                           schedule_ocr=schedule_ocr, crop_keep=crop_keep, crop_archive=crop_archive,
+                           crop_shard_size=crop_shard_size, session=session)
+        print("Fused pipeline complete.")
+        write_run_report(output_folder, video_path, start)
+        return
+
+    # 1. Run detection and tracking
+    print("Step 1: Running detection and tracking...")
+    if detect_shards > 1:
+        detect_and_track_sharded(video_path, raw_csv_path, vehicle_output_folder, plate_output_folder,
+                                 shards=detect_shards, overlap=shard_overlap, ocr_server=ocr_server,
+                                 batch_size=batch_size, threaded=threaded, ocr_workers=ocr_workers,
+                                 plate_roi=plate_roi, roi_size=roi_size, schedule_ocr=schedule_ocr,
+                                 crop_keep=crop_keep, crop_archive=crop_archive, crop_shard_size=crop_shard_size,
+                                 max_stride=max_stride, min_changed=min_changed,
+                                 checkpoint_every=checkpoint_every, resume=resume)
+    else:
+        detect_and_track(video_path, raw_csv_path, vehicle_output_folder, plate_output_folder, batch_size=batch_size,
+                         threaded=threaded, ocr_workers=ocr_workers, plate_roi=plate_roi, roi_size=roi_size,
+                         schedule_ocr=schedule_ocr, preview_every=preview_every, crop_keep=crop_keep,
+                         crop_archive=crop_archive, crop_shard_size=crop_shard_size, session=session,
+                         max_stride=max_stride, min_changed=min_changed, checkpoint_every=checkpoint_every,
+                         resume=resume)
+    print("Detection and tracking complete.")
+
+    # 2. Process missing data
+    print("\nStep 2: Processing and interpolating data...")
+    process_missing_data(raw_csv_path, processed_csv_path, max_gap=max_gap)
+    print("Data processing complete.")
+
+    # 3. Generate visualized video
+    print("\nStep 3: Generating visualized video...")
+    generate_video(processed_csv_path, video_path, output_video_path, workers=render_workers)
+    print("Visualization complete.")
+
+    write_run_report(output_folder, video_path, start)
+
+def write_run_report(output_folder, video_path, start):
+    report_path = os.path.join(output_folder, 'run_report.json')
+    report = timer.write_report(report_path, video=video_path, wall_s=round(time.perf_counter() - start, 3))
+    print(f"\nRun report saved to {report_path}")
+    for name, stats in report['stages'].items():
+        print(f"  {name}: {stats['count']} x, p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+              f"p99 {stats['p99_ms']} ms, total {stats['total_s']} s")
+
+def list_videos(batch_input):
+    """
+    Returns the videos of a batch: the video files in a directory, or the paths
+    listed one per line in a manifest file (blank lines and # comments are skipped).
+    """
+    if os.path.isdir(batch_input):
+        return [os.path.join(batch_input, name) for name in sorted(os.listdir(batch_input))
+                if name.lower().endswith(VIDEO_EXTENSIONS)]
+
+    base = os.path.dirname(batch_input)
+    with open(batch_input, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+def video_output_folders(videos, output_folder):
+    """
+    Gives every video its own output folder named after the video file.
+    """
+    folders = []
+    used = set()
+    for video in videos:
+        name = os.path.splitext(os.path.basename(video))[0]
+        folder_name, n = name, 1
+        while folder_name in used:
+            n += 1
+            folder_name = f"{name}_{n}"
+        used.add(folder_name)
+        folders.append(os.path.join(output_folder, folder_name))
+    return folders
+
+def run_video(video_path, output_folder, options):
+    """
+    Processes one video in a worker and returns its throughput record.
+    """
+    cap = cv2.VideoCapture(video_path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    start = time.perf_counter()
+    error = None
+    try:
+        process_video(video_path, output_folder, worker_session(), **options)
+    except Exception as e:
+        error = str(e)
+        print(f"Error processing {video_path}: {e}")
+    return {'video': video_path, 'worker': os.getpid(), 'frames': frames,
+            'seconds': time.perf_counter() - start, 'error': error}
+
+def run_batch(batch_input, output_folder, options, workers=2, ocr_server=None):
+    """
+    Processes every video of a directory or manifest on a pool of worker processes.
+
+    Each worker loads its own models once (see models.init_worker) and each video
+    is written to its own folder under output_folder. Returns the per-video records
+    after printing a throughput summary.
+    """
+    videos = list_videos(batch_input)
+    if not videos:
+        print(f"No videos found in {batch_input}")
+        return []
+
+    # Workers cannot open preview windows
+    options = dict(options, preview_every=0)
+    records = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(ocr_server,)) as executor:
+        futures = {executor.submit(run_video, video, folder, options): video
+                   for video, folder in zip(videos, video_output_folders(videos, output_folder))}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # A worker that died (e.g. killed for memory) breaks the pool for the videos still queued
+                print(f"Error processing {futures[future]}: {e!r}")
+                record = {'video': futures[future], 'worker': None, 'frames': 0, 'seconds': 0.0, 'error': repr(e)}
+            records.append(record)
+            status = 'failed' if record['error'] else f"{record['frames'] / record['seconds']:.1f} frames/s"
+            print(f"[{len(records)}/{len(videos)}] {record['video']}: {status}")
+    elapsed = time.perf_counter() - start
+
+    print_batch_summary(records, elapsed)
+    return records
+
+def print_batch_summary(records, elapsed):
+    per_worker = defaultdict(lambda: {'videos': 0, 'frames': 0, 'seconds': 0.0})
+    for record in records:
+        if record['error']:
+            continue
+        stats = per_worker[record['worker']]
+        stats['videos'] += 1
+        stats['frames'] += record['frames']
+        stats['seconds'] += record['seconds']
+
+    failed = sum(1 for record in records if record['error'])
+    total_frames = sum(stats['frames'] for stats in per_worker.values())
+    print(f"\nProcessed {len(records) - failed} videos ({failed} failed), {total_frames} frames in {elapsed:.1f}s: "
+          f"{total_frames / elapsed:.1f} frames/s total")
+    for worker, stats in sorted(per_worker.items()):
+        fps = stats['frames'] / stats['seconds'] if stats['seconds'] else 0.0
+        print(f"  worker {worker}: {stats['videos']} videos, {stats['frames']} frames, {fps:.1f} frames/s")
@@ -0,0 +1,277 @@
+
+"""
+Benchmark harness that runs the pipeline stages on synthetic traffic videos.
+
+The videos show rectangular cars with Korean license plates (e.g. 12가3456)
+moving across a static background. Detection uses colour-threshold stand-ins
+for the YOLO models and a fixed-answer OCR reader, so the benchmark runs on a
+CPU-only machine without model weights and measures the pipeline itself.
+
+Example:
+    python benchmark.py --width 1280 --height 720 --frames 300 --cars 6 --output benchmark_results.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from util import char_list, get_car, write_csv, set_reader
+from detector import detect_and_track
+from data_processor import process_missing_data
+from visualizer import generate_video
+from sort.sort import KalmanBoxTracker
+from timing import timer
+
+BACKGROUND = 40
+PLATE_HANGUL = [c for c in char_list if not c.isdigit()]
+KOREAN_FONT_PATTERNS = ['/usr/share/fonts/**/Nanum*.ttf', '/usr/share/fonts/**/NotoSansCJK*.tt[cf]',
+                        '/usr/share/fonts/**/NotoSansKR*.[ot]tf', '/Library/Fonts/AppleGothic.ttf',
+                        '/System/Library/Fonts/AppleSDGothicNeo.ttc', 'C:/Windows/Fonts/malgun.ttf']
+
+def random_plate(rng):
+    return f"{rng.integers(10, 100)}{rng.choice(PLATE_HANGUL)}{rng.integers(1000, 10000)}"
+
+def find_korean_font():
+    for pattern in KOREAN_FONT_PATTERNS:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if matches:
+            return matches[0]
+    return None
+
+def render_plate(text, width, height, font_path=None):
+    """
+    Renders plate text black on white. Without a Korean font the Hangul is left out.
+    """
+    image = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    if font_path:
+        font = ImageFont.truetype(font_path, max(int(height * 0.6), 8))
+    else:
+        font = ImageFont.load_default()
+        text = ''.join(c for c in text if c.isdigit() or c == ' ')
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    draw.text(((width - (right - left)) / 2 - left, (height - (bottom - top)) / 2 - top), text,
+              fill=(0, 0, 0), font=font)
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+
+def paste(frame, image, x, y):
+    """
+    Copies image into frame at (x, y), clipped to the frame.
+    """
+    h, w = image.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+    if x2 > x1 and y2 > y1:
+        frame[y1:y2, x1:x2] = image[y1 - y:y2 - y, x1 - x:x2 - x]
+
+def make_synthetic_video(path, width=1280, height=720, frames=300, cars=6, fps=30, seed=0, font_path=None):
+    """
+    Writes a video of cars driving across the frame in lanes and returns the plate texts used.
+
+    cars sets how many cars are on screen at once; a car that leaves the frame is
+    replaced by a new one with a new plate on the other side.
+    """
+    rng = np.random.default_rng(seed)
+    car_w, car_h = width // 8, height // 8
+    plate_w, plate_h = car_w // 2, max(car_h // 5, 12)
+    lanes = np.linspace(car_h // 2, height - car_h * 3 // 2, cars).astype(int)
+
+    def new_car(lane, x=None):
+        speed = rng.uniform(2, 8) * width / 1280
+        plate = random_plate(rng)
+        return {'x': float(rng.uniform(-car_w, width)) if x is None else x, 'y': int(lane), 'speed': speed,
+                'color': tuple(int(c) for c in rng.integers(60, 200, 3)), 'plate': plate,
+                'plate_image': render_plate(plate, plate_w, plate_h, font_path)}
+
+    fleet = [new_car(lane) for lane in lanes]
+    plates = [car['plate'] for car in fleet]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for _ in range(frames):
+        frame = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+        for i, car in enumerate(fleet):
+            car['x'] += car['speed']
+            if car['x'] > width:
+                fleet[i] = car = new_car(car['y'], x=float(-car_w))
+                plates.append(car['plate'])
+            x, y = int(car['x']), car['y']
+            cv2.rectangle(frame, (x, y), (x + car_w, y + car_h), car['color'], -1)
+            paste(frame, car['plate_image'], x + (car_w - plate_w) // 2, y + car_h - plate_h - car_h // 10)
+        out.write(frame)
+    out.release()
+    return plates
+
+class _Boxes:
+    def __init__(self, rows):
+        self.data = np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+class _Result:
+    def __init__(self, rows):
+        self.boxes = _Boxes(rows)
+
+class ColorDetector:
+    """
+    Stand-in for a YOLO model on synthetic videos: finds cars (anything that is
+    not background) or plates (white regions) by thresholding.
+    """
+    def __init__(self, plates=False, min_area=30):
+        self.plates = plates
+        self.min_area = min_area
+
+    def _detect(self, frame):
+        if self.plates:
+            mask = cv2.inRange(frame, (230, 230, 230), (255, 255, 255))
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+            class_id = 0
+        else:
+            mask = (np.abs(frame.astype(np.int16) - BACKGROUND).max(axis=2) > 10).astype(np.uint8)
+            class_id = 2
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        rows = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w * h >= self.min_area:
+                rows.append([x, y, x + w, y + h, 0.9, class_id])
+        return _Result(rows)
+
+    def __call__(self, source, **kwargs):
+        if isinstance(source, list):
+            return [self._detect(frame) for frame in source]
+        return [self._detect(source)]
+
+class FixedReader:
+    """
+    Stand-in for the EasyOCR reader that always reads the same valid plate.
+    """
+    def __init__(self, text='12가 3456', score=0.9):
+        self.text = text
+        self.score = score
+
+    def readtext(self, image):
+        h, w = image.shape[:2]
+        return [([[0, 0], [w, 0], [w, h], [0, h]], self.text, self.score)]
+
+class StubSession:
+    """
+    Model session (see models.ModelSession) made of the stand-in detectors.
+    """
+    def __init__(self):
+        self.coco_model = ColorDetector()
+        self.license_plate_detector = ColorDetector(plates=True)
+
+def measure(name, items, fn, results):
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    results[name] = {'items': items, 'seconds': round(seconds, 4), 'per_second': round(items / seconds, 1)}
+    print(f"{name}: {items} items in {seconds:.3f}s ({items / seconds:.1f}/s)")
+
+def synthetic_results(frames, cars, rng):
+    """
+    Builds a results dict as collected by the detector, for frames x cars entries.
+    """
+    results = {}
+    for frame_nmr in range(frames):
+        results[frame_nmr] = {}
+        for car_id in range(cars):
+            x, y = rng.uniform(0, 1000, 2)
+            results[frame_nmr][car_id] = {
+                'car': {'bbox': [x, y, x + 160, y + 90]},
+                'license_plate': {'bbox': [x + 40, y + 60, x + 120, y + 80], 'text': random_plate(rng),
+                                  'bbox_score': 0.9, 'text_score': 0.8}
+            }
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(width=1280, height=720, frames=300, cars=6, seed=0, workdir=None, font_path=None):
+    """
+    Generates a synthetic video and times every stage on it. Returns the results dict.
+    """
+    font_path = font_path or find_korean_font()
+    if font_path is None:
+        print("No Korean font found; plates are rendered without Hangul (use --font)")
+    rng = np.random.default_rng(seed)
+    video_path = os.path.join(workdir, 'synthetic.mp4')
+    raw_csv_path = os.path.join(workdir, 'raw_results.csv')
+    processed_csv_path = os.path.join(workdir, 'processed_results.csv')
+    results = {}
+
+    measure('make_synthetic_video', frames,
+            lambda: make_synthetic_video(video_path, width, height, frames, cars, seed=seed, font_path=font_path),
+            results)
+
+    # get_car: every plate of a frame against every tracked car
+    plates = [[x + 40, y + 60, x + 120, y + 80, 0.9, 0] for x, y in rng.uniform(0, 1000, (cars * 100, 2))]
+    track_ids = [[x, y, x + 160, y + 90, i] for i, (x, y) in enumerate(rng.uniform(0, 1000, (cars, 2)))]
+    measure('get_car', len(plates), lambda: [get_car(plate, track_ids) for plate in plates], results)
+
+    csv_results = synthetic_results(frames, cars, rng)
+    measure('write_csv', frames * cars, lambda: write_csv(csv_results, os.path.join(workdir, 'write_csv.csv')),
+            results)
+
+    set_reader(FixedReader())
+    KalmanBoxTracker.count = 0
+    timer.reset()
+    measure('detect_and_track', frames,
+            lambda: detect_and_track(video_path, raw_csv_path, os.path.join(workdir, 'vehicles'),
+                                     os.path.join(workdir, 'plates'), session=StubSession(), preview_every=0),
+            results)
+    set_reader(None)
+
+    measure('process_missing_data', frames, lambda: process_missing_data(raw_csv_path, processed_csv_path), results)
+    measure('generate_video', frames,
+            lambda: generate_video(processed_csv_path, video_path, os.path.join(workdir, 'output_video.mp4')),
+            results)
+
+    return {
+        'commit': git_commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {'width': width, 'height': height, 'frames': frames, 'cars': cars, 'seed': seed,
+                   'korean_font': font_path is not None},
+        'results': results,
+        'stages': timer.summary()
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic traffic videos.")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--cars', type=int, default=6, help="cars on screen at once")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--font', default=None, help="TrueType font with Hangul for the plate text")
+    parser.add_argument('--workdir', default=None, help="keep the generated files here instead of a temp dir")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='lpr-benchmark-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        report = run_benchmark(args.width, args.height, args.frames, args.cars, args.seed, workdir, args.font)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Benchmark results saved to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+
+import os
+import pickle
+
+def checkpoint_path(results_path):
+    """
+    Returns the path of the checkpoint kept next to a raw results file.
+    """
+    return os.path.splitext(results_path)[0] + '.checkpoint.pkl'
+
+def save_checkpoint(path, state):
+    """
+    Pickles state to path, replacing the previous checkpoint atomically.
+
+    A crash while saving leaves the previous checkpoint intact.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """
+    Returns the state saved with save_checkpoint, or None if there is no checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def remove_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
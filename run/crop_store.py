@@ -0,0 +1,137 @@
+
+import heapq
+import io
+import itertools
+import os
+import tarfile
+import threading
+import time
+import cv2
+from stages import WorkerPool
+from timing import timer
+
+def crop_quality(crop, score):
+    """
+    Ranks crops of the same track: a confident detection of a large crop wins.
+    """
+    return float(score) * crop.shape[0] * crop.shape[1]
+
+class CropArchive:
+    """
+    Appends encoded crops to tar files instead of writing one file per crop.
+
+    With shard_size > 0 a new tar file is started every shard_size crops.
+    """
+    def __init__(self, folder, shard_size=0):
+        self.folder = folder
+        self.shard_size = shard_size
+        self._lock = threading.Lock()
+        self._tar = None
+        self._shard = 0
+        self._count = 0
+
+    def add(self, name, data):
+        with self._lock:
+            if self._tar is None:
+                self._tar = tarfile.open(os.path.join(self.folder, f"crops_{self._shard:05d}.tar"), 'w')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._tar.addfile(info, io.BytesIO(data))
+            self._count += 1
+            if self.shard_size and self._count % self.shard_size == 0:
+                self._tar.close()
+                self._tar = None
+                self._shard += 1
+
+    def close(self):
+        with self._lock:
+            if self._tar is not None:
+                self._tar.close()
+                self._tar = None
+
+class CropStore(WorkerPool):
+    """
+    Saves vehicle and plate crops on background threads.
+
+    With keep=0 every crop passed to offer is written right away. With
+    keep=K only the K best crops of each track are kept (see crop_quality); they
+    are held in memory and written once the track has not been offered a crop
+    for idle_frames frames, or when the store is closed.
+
+    With archive=True crops are JPEG-encoded into tar files in their output
+    folder (see CropArchive) instead of one image file per crop.
+    """
+    def __init__(self, keep=0, archive=False, shard_size=0, idle_frames=30, workers=1, maxsize=64):
+        super().__init__('writer', workers, maxsize)
+        self.keep = keep
+        self.archive = archive
+        self.shard_size = shard_size
+        self.idle_frames = idle_frames
+        self._archives = {}
+        self._archives_lock = threading.Lock()
+        self._best = {}
+        self._last_seen = {}
+        self._order = itertools.count()
+
+    def _archive_for(self, folder):
+        with self._archives_lock:
+            if folder not in self._archives:
+                self._archives[folder] = CropArchive(folder, self.shard_size)
+            return self._archives[folder]
+
+    def _save(self, path, image):
+        with timer.stage('crop write'):
+            return self._write_image(path, image)
+
+    def _write_image(self, path, image):
+        if not self.archive:
+            return cv2.imwrite(path, image)
+        ok, encoded = cv2.imencode(os.path.splitext(path)[1] or '.jpg', image)
+        if ok:
+            self._archive_for(os.path.dirname(path)).add(os.path.basename(path), encoded.tobytes())
+        return ok
+
+    def write(self, path, image):
+        # The crop is a view into a frame that is reused once track_frame returns
+        return self.submit(self._save, path, image.copy())
+
+    def offer(self, path, car_id, image, score, frame_nmr):
+        """
+        Saves the crop of track car_id, or holds it if it is among the track's best.
+        """
+        if not self.keep:
+            return self.write(path, image)
+
+        self._last_seen[car_id] = frame_nmr
+        # Vehicle and plate crops of a track are ranked separately
+        best = self._best.setdefault(car_id, {}).setdefault(os.path.dirname(path), [])
+        quality = crop_quality(image, score)
+        if len(best) < self.keep:
+            heapq.heappush(best, (quality, next(self._order), path, image.copy()))
+        elif quality > best[0][0]:
+            heapq.heapreplace(best, (quality, next(self._order), path, image.copy()))
+
+    def flush_idle(self, frame_nmr):
+        """
+        Writes the kept crops of tracks that have been idle for idle_frames frames.
+        """
+        if not self.keep:
+            return
+        idle = [car_id for car_id, last_seen in self._last_seen.items() if frame_nmr - last_seen > self.idle_frames]
+        for car_id in idle:
+            self._flush_track(car_id)
+
+    def _flush_track(self, car_id):
+        del self._last_seen[car_id]
+        for best in self._best.pop(car_id).values():
+            for _, _, path, image in best:
+                # Kept crops are private copies already
+                self.submit(self._save, path, image)
+
+    def close(self):
+        for car_id in list(self._best):
+            self._flush_track(car_id)
+        super().close()
+        for archive in self._archives.values():
+            archive.close()
@@ -1,64 +1,160 @@
 
 import pandas as pd
-from scipy.interpolate import interp1d
 import numpy as np
-import ast
+from timing import timer
+from util import (RESULT_COLUMNS, CAR_BBOX_COLUMNS, PLATE_BBOX_COLUMNS, COLUMNAR_DTYPES,
+                  read_results_npz, write_results_npz, parse_bboxes, format_bboxes, read_skipped_frames)
+
+def load_results(input_path):
+    """
+    Loads detection results from a CSV or .npz file into a DataFrame.
+
+    Bounding boxes are returned as separate float coordinate columns
+    (util.CAR_BBOX_COLUMNS and util.PLATE_BBOX_COLUMNS) instead of strings.
+    """
+    if input_path.endswith('.npz'):
+        return pd.DataFrame(read_results_npz(input_path))
+
+    df = pd.read_csv(input_path)
+    df[CAR_BBOX_COLUMNS] = parse_bboxes(df['car_bbox'].astype(str).tolist())
+    df[PLATE_BBOX_COLUMNS] = parse_bboxes(df['license_plate_bbox'].astype(str).tolist())
+    df['frame_nmr'] = df['frame_nmr'].astype(np.int32)
+    df['car_id'] = df['car_id'].astype(np.int32)
+    return df[list(COLUMNAR_DTYPES)]
+
+def save_results(df, output_path):
+    """
+    Saves results loaded with load_results to a CSV or .npz file.
+    """
+    if output_path.endswith('.npz'):
+        write_results_npz(output_path, {column: df[column].to_numpy() for column in COLUMNAR_DTYPES})
+        return
+
+    df = df.copy()
+    df['car_bbox'] = format_bboxes(df[CAR_BBOX_COLUMNS].to_numpy())
+    df['license_plate_bbox'] = format_bboxes(df[PLATE_BBOX_COLUMNS].to_numpy())
+    df[RESULT_COLUMNS].to_csv(output_path, index=False)
+
+def interpolate_segments(segment_ids, frames, values):
+    """
+    Linearly interpolates values within each segment, for all segments at once.
+
+    segment_ids and frames must be sorted by (segment, frame). Rows whose values
+    are NaN are filled from the nearest known rows of the same segment, and rows
+    before the first or after the last known row are extrapolated from the two
+    nearest known rows, like interp1d(..., fill_value="extrapolate"). Segments
+    with fewer than two known rows are left unchanged.
+    """
+    values = np.array(values, dtype=float)
+    known = ~np.isnan(values).any(axis=1)
+    known_idx = np.flatnonzero(known)
+
+    # Number of known rows per segment, broadcast back to every row
+    segments, segment_inverse = np.unique(segment_ids, return_inverse=True)
+    known_per_segment = np.bincount(segment_inverse[known_idx], minlength=len(segments))
+    known_start = np.concatenate(([0], np.cumsum(known_per_segment)))
+    row_known_count = known_per_segment[segment_inverse]
+    usable = row_known_count >= 2
+    if not usable.any():
+        return values
+
+    # Known row to the right of each row, clipped into the same segment so the
+    # first and last two known rows are used for extrapolation
+    first_known = known_start[segment_inverse]
+    last_known = known_start[segment_inverse + 1] - 1
+    right = np.searchsorted(known_idx, np.arange(len(values)), side='left')
+    right = np.clip(right, first_known + 1, np.maximum(last_known, first_known + 1))
+    left = right - 1
+
+    rows = np.flatnonzero(usable)
+    left_rows = known_idx[left[rows]]
+    right_rows = known_idx[right[rows]]
+    left_frames = frames[left_rows].astype(float)
+    span = frames[right_rows] - left_frames
+    ratio = np.divide(frames[rows] - left_frames, span, out=np.zeros(len(rows)), where=span != 0)
+    values[rows] = values[left_rows] + ratio[:, None] * (values[right_rows] - values[left_rows])
+    return values
 
 def interpolate_bounding_boxes(data):
-    """Interpolates missing bounding boxes for a given car ID."""
-    
-    # Ensure data is sorted by frame number
-    data = data.sort_values(by='frame_nmr')
-    
-    # Convert string representation of list to actual list
-    data['license_plate_bbox'] = data['license_plate_bbox'].apply(ast.literal_eval)
-    
-    # Filter out rows where bounding box is missing
-    known_data = data[data['license_plate_bbox'].apply(lambda x: len(x) == 4)]
-    
-    if len(known_data) < 2:
-        # Not enough data to interpolate
-        return data
+    """
+    Interpolates missing car and license plate bounding boxes for every car ID.
+
+    The data is sorted once by (car_id, frame_nmr) and all cars are interpolated
+    together with array operations instead of one interpolator per car.
+    """
+    data = data.sort_values(by=['car_id', 'frame_nmr'], kind='stable').reset_index(drop=True)
+    car_ids = data['car_id'].to_numpy()
+    frames = data['frame_nmr'].to_numpy()
+
+    for columns in (PLATE_BBOX_COLUMNS, CAR_BBOX_COLUMNS):
+        data[columns] = interpolate_segments(car_ids, frames, data[columns].to_numpy()).astype(data[columns[0]].dtype)
 
-    # Frame numbers for which we have bounding boxes
-    known_frames = known_data['frame_nmr'].values
-    
-    # Bounding box coordinates
-    bboxes = np.array(known_data['license_plate_bbox'].tolist())
-    
-    # Create interpolation functions for each coordinate
-    interp_funcs = [interp1d(known_frames, bboxes[:, i], kind='linear', fill_value="extrapolate") for i in range(4)]
-    
-    # All frame numbers for this car
-    all_frames = data['frame_nmr'].values
-    
-    # Interpolate for all frames
-    interpolated_bboxes = [
-        [f(frame) for f in interp_funcs] for frame in all_frames
-    ]
-    
-    # Update the dataframe with interpolated values
-    data['license_plate_bbox'] = interpolated_bboxes
-    
     return data
 
-def process_missing_data(input_csv_path, output_csv_path):
+def fill_gaps(data, max_gap, skipped_frames=None):
+    """
+    Adds a row for every frame missing between two observations of the same car.
+
+    Only gaps of at most max_gap frames, or gaps made up entirely of
+    skipped_frames (frames the detector did not run on), are filled. New rows have no bounding
+    boxes yet (NaN), 'Unknown' text and zero scores, so interpolate_bounding_boxes
+    can fill their boxes afterwards. All rows are created in one vectorized pass.
+    """
+    data = data.sort_values(by=['car_id', 'frame_nmr'], kind='stable').reset_index(drop=True)
+    car_ids = data['car_id'].to_numpy()
+    frames = data['frame_nmr'].to_numpy()
+
+    missing = np.diff(frames) - 1
+    too_long = missing > max_gap
+    if skipped_frames is not None and len(skipped_frames):
+        skipped_frames = np.sort(skipped_frames)
+        skipped_in_gap = (np.searchsorted(skipped_frames, frames[1:], side='left') -
+                          np.searchsorted(skipped_frames, frames[:-1], side='right'))
+        too_long &= skipped_in_gap != missing
+    missing[(car_ids[1:] != car_ids[:-1]) | too_long] = 0
+    missing = np.maximum(missing, 0)
+    total = missing.sum()
+    if total == 0:
+        return data
+
+    # Row i contributes missing[i] new frames: frames[i] + 1, ..., frames[i] + missing[i]
+    left = np.repeat(np.arange(len(missing)), missing)
+    step = np.arange(total) - np.repeat(np.cumsum(missing) - missing, missing) + 1
+
+    gaps = pd.DataFrame({column: np.full(total, np.nan) for column in data.columns})
+    gaps['frame_nmr'] = frames[left] + step
+    gaps['car_id'] = car_ids[left]
+    gaps['license_number'] = 'Unknown'
+    gaps['license_plate_bbox_score'] = 0
+    gaps['license_number_score'] = 0
+    gaps = gaps.astype(data.dtypes.to_dict())
+
+    data = pd.concat([data, gaps], ignore_index=True)
+    return data.sort_values(by=['car_id', 'frame_nmr'], kind='stable').reset_index(drop=True)
+
+def process_missing_data(input_csv_path, output_csv_path, max_gap=0):
     """
     Reads detection results, interpolates missing data, and saves the result.
+
+    Either path may be a CSV or a columnar .npz file (see load_results). With
+    max_gap > 0, frames where a car was missing for at most max_gap frames get
+    an interpolated row as well (see fill_gaps). Frames the detector skipped
+    (see util.read_skipped_frames) are always filled.
     """
     try:
-        df = pd.read_csv(input_csv_path)
+        df = load_results(input_csv_path)
     except FileNotFoundError:
         print(f"Error: Input file not found at {input_csv_path}")
         return
 
-    # Group by car_id and apply interpolation
-    interpolated_results = df.groupby('car_id').apply(interpolate_bounding_boxes)
-    
-    # Drop the extra index created by groupby
-    interpolated_results = interpolated_results.reset_index(drop=True)
-    
+    with timer.stage('interpolation'):
+        skipped_frames = read_skipped_frames(input_csv_path)
+        if max_gap > 0 or skipped_frames is not None:
+            df = fill_gaps(df, max_gap, skipped_frames)
+
+        # Interpolate all cars at once
+        interpolated_results = interpolate_bounding_boxes(df)
+
     # Save the processed data
-    interpolated_results.to_csv(output_csv_path, index=False)
+    save_results(interpolated_results, output_csv_path)
     print(f"Processed data saved to {output_csv_path}")
-
@@ -1,21 +1,395 @@
 
+import copy
 import os
-from ultralytics import YOLO
 import cv2
 import numpy as np
-from util import get_car, read_license_plate, write_csv
-from sort.sort import Sort
+from collections import Counter, deque
+from util import (get_cars, read_license_plate, open_result_writer, letterbox, box_iou, OcrScheduler, MotionGate,
+                  write_skipped_frames, skipped_frames_path)
+from stages import Stage, WorkerPool, format_queue_depths
+from crop_store import CropStore
+from annotations import FrameAnnotations
+from models import ModelSession
+from checkpoint import checkpoint_path, save_checkpoint, load_checkpoint, remove_checkpoint
+from timing import timer
+from sort.sort import Sort, KalmanBoxTracker
 from correct_license_plate import correct_perspective, preprocess_license_plate
 
-def detect_and_track(video_path, output_csv_path, vehicle_output_folder, plate_output_folder):
+VEHICLES = [2, 3, 5, 7]
+
+def read_frames(cap, start_frame=0, end_frame=None):
+    """
+    Yields (frame_nmr, frame) pairs from start_frame until end_frame or the end of the video.
+    """
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    frame_nmr = start_frame - 1
+    while end_frame is None or frame_nmr + 1 < end_frame:
+        with timer.stage('decode'):
+            ret, frame = cap.read()
+        if not ret:
+            return
+        frame_nmr += 1
+        yield frame_nmr, frame
+
+def skip_static_frames(frames, motion_gate, skipped, gate_states=None):
+    """
+    Yields the frames motion_gate wants inferred and appends the numbers of the others to skipped.
+
+    If gate_states is a dict, a copy of the gate as it was after each yielded
+    frame is stored under the frame number. The decode thread runs ahead of
+    tracking, so a checkpoint must save this copy rather than the gate itself.
+    """
+    for frame_nmr, frame in frames:
+        if motion_gate.should_process(frame):
+            if gate_states is not None:
+                # should_process replaces the reference thumbnail instead of changing it
+                gate_states[frame_nmr] = copy.copy(motion_gate)
+            yield frame_nmr, frame
+        else:
+            skipped.append(frame_nmr)
+
+def iter_batches(frames, batch_size):
+    """
+    Groups (frame_nmr, frame) pairs into lists of at most batch_size.
+    """
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def infer_batches(batches, coco_model, license_plate_detector):
+    """
+    Yields a list of (frame_nmr, frame, detections, license_plates) per batch.
+    """
+    for batch in batches:
+        batch_detections = detect_batch([frame for _, frame in batch], coco_model, license_plate_detector)
+        yield [(frame_nmr, frame, detections, license_plates)
+               for (frame_nmr, frame), (detections, license_plates) in zip(batch, batch_detections)]
+
+def read_plate_crop(license_plate_crop):
+    """
+    Runs OCR on a license plate crop and returns (text, score) as stored in the results.
+    """
+    with timer.stage('ocr'):
+        license_plate_text, license_plate_text_score = read_license_plate(license_plate_crop)
+
+    if not license_plate_text:
+        return 'Unknown', 0
+    return license_plate_text, license_plate_text_score
+
+def save_crop(path, crop, crop_store=None, car_id=None, score=0, frame_nmr=0):
+    if crop_store is None:
+        cv2.imwrite(path, crop)
+    elif car_id is None:
+        crop_store.write(path, crop)
+    else:
+        crop_store.offer(path, car_id, crop, score, frame_nmr)
+
+def save_track_crops(frame, frame_nmr, vehicles, track_ids, vehicle_output_folder, crop_store):
+    """
+    Offers each tracked vehicle's crop to crop_store, keyed by its track ID.
+
+    A track is matched to the vehicle detection it overlaps most; tracks that
+    were only predicted in this frame have no detection and are skipped.
+    """
+    if not len(vehicles) or not len(track_ids):
+        return
+    ious = box_iou(track_ids, vehicles)
+    matches = ious.argmax(axis=1)
+    for track, match, iou in zip(track_ids, matches, ious[np.arange(len(matches)), matches]):
+        if iou == 0:
+            continue
+        x1, y1, x2, y2, score, class_id = vehicles[match]
+        car_id = track[4]
+        vehicle_image_path = os.path.join(vehicle_output_folder,
+                                          f"car_{int(car_id)}_frame_{frame_nmr:04d}_vehicle_{int(class_id)}_{int(score*100)}.jpg")
+        save_crop(vehicle_image_path, frame[int(y1):int(y2), int(x1):int(x2)], crop_store, car_id, score, frame_nmr)
+
+def resolve_frame_results(frame_results):
+    """
+    Waits for pending OCR of a frame and fills in the license plate text.
+    """
+    for entry in frame_results.values():
+        text_future = entry['license_plate'].pop('text_future', None)
+        if text_future is not None:
+            entry['license_plate']['text'], entry['license_plate']['text_score'] = text_future.result()
+    return frame_results
+
+def write_finished_frames(pending, writer, wait=False):
+    """
+    Writes frames from the front of pending once their OCR is done, keeping frame order.
+
+    With wait=True every pending frame is resolved and written.
+    """
+    while pending:
+        frame_nmr, frame_results = pending[0]
+        if not wait and not all(entry['license_plate']['text_future'].done()
+                                for entry in frame_results.values() if 'text_future' in entry['license_plate']):
+            return
+        pending.popleft()
+        frame_results = resolve_frame_results(frame_results)
+        with timer.stage('results write'):
+            writer.write_frame(frame_nmr, frame_results)
+
+def detect_batch(frames, coco_model, license_plate_detector):
+    """
+    Runs the vehicle and license plate detectors on a batch of frames.
+
+    Returns a list with one (vehicle detections, license plate detections) pair per frame.
+    If license_plate_detector is None only vehicles are detected and the plate
+    detections are None.
+    """
+    with timer.stage('vehicle detection', len(frames)):
+        vehicle_detections = coco_model(frames)
+    if license_plate_detector is None:
+        return [(detections, None) for detections in vehicle_detections]
+    with timer.stage('plate detection', len(frames)):
+        plate_detections = license_plate_detector(frames)
+    return list(zip(vehicle_detections, plate_detections))
+
+def detect_plates_in_rois(frame, track_ids, license_plate_detector, roi_size=320):
+    """
+    Runs the license plate detector on the tracked vehicle regions of a frame.
+
+    Each vehicle box is cropped, letterboxed to roi_size x roi_size and the crops
+    are detected as one batch. Returns plate rows (x1, y1, x2, y2, score, class_id)
+    in frame coordinates.
+    """
+    height, width = frame.shape[:2]
+    crops = []
+    offsets = []
+    for xcar1, ycar1, xcar2, ycar2, car_id in track_ids:
+        xcar1, ycar1 = max(int(xcar1), 0), max(int(ycar1), 0)
+        xcar2, ycar2 = min(int(xcar2), width), min(int(ycar2), height)
+        if xcar2 <= xcar1 or ycar2 <= ycar1:
+            continue
+        crop, scale, (pad_x, pad_y) = letterbox(frame[ycar1:ycar2, xcar1:xcar2], roi_size)
+        crops.append(crop)
+        offsets.append((xcar1, ycar1, scale, pad_x, pad_y))
+
+    if not crops:
+        return []
+
+    license_plates = []
+    for plates, (xcar1, ycar1, scale, pad_x, pad_y) in zip(license_plate_detector(crops, imgsz=roi_size), offsets):
+        for x1, y1, x2, y2, score, class_id in plates.boxes.data.tolist():
+            license_plates.append([(x1 - pad_x) / scale + xcar1, (y1 - pad_y) / scale + ycar1,
+                                   (x2 - pad_x) / scale + xcar1, (y2 - pad_y) / scale + ycar1,
+                                   score, class_id])
+    return license_plates
+
+def process_frame(frame, frame_nmr, coco_model, license_plate_detector, mot_tracker,
+                  vehicle_output_folder, plate_output_folder, annotate=True, plate_roi=False, roi_size=320,
+                  ocr_scheduler=None, crop_store=None, counts=None):
+    """
+    Runs vehicle detection, tracking and license plate reading on a single frame.
+
+    Returns a dict mapping car_id to the car and license plate entry for this frame.
+    When annotate is True the boxes and labels are drawn onto the frame once all
+    crops have been taken; when it is False the frame is left untouched.
+    """
+    annotations = FrameAnnotations() if annotate else None
+    if plate_roi:
+        detections, license_plates = detect_batch([frame], coco_model, None)[0]
+    else:
+        detections, license_plates = detect_batch([frame], coco_model, license_plate_detector)[0]
+    frame_results = track_frame(frame, frame_nmr, detections, license_plates, mot_tracker,
+                                vehicle_output_folder, plate_output_folder, annotations=annotations,
+                                license_plate_detector=license_plate_detector if plate_roi else None,
+                                roi_size=roi_size, ocr_scheduler=ocr_scheduler, crop_store=crop_store,
+                                counts=counts)
+    if annotations is not None:
+        annotations.draw(frame)
+    return frame_results
+
+def track_frame(frame, frame_nmr, detections, license_plates, mot_tracker,
+                vehicle_output_folder, plate_output_folder, annotations=None, ocr_pool=None, crop_store=None,
+                license_plate_detector=None, roi_size=320, ocr_scheduler=None, counts=None):
+    """
+    Tracks vehicles and reads license plates from the detector output of one frame.
+
+    Frames must be passed in order since the SORT tracker is stateful. With an
+    ocr_pool, OCR runs in the background and the entries hold a 'text_future'
+    until resolve_frame_results is called; with a crop_store, crops are saved
+    asynchronously (see crop_store.CropStore). If license_plates is None, plates
+    are detected with license_plate_detector inside the tracked vehicle boxes
+    only. With an ocr_scheduler, OCR only runs when the scheduler asks for it and
+    the other frames reuse the track's current reading.
+
+    The frame itself is never drawn on. Boxes and labels are recorded in
+    annotations, if given, to be drawn once the crops of the frame are taken.
+
+    Plates that fall outside every tracked vehicle are added to
+    counts['unassigned plates'] if a counts Counter is given.
+    """
+    frame_results = {}
+    detections_ = []
+    vehicles = []
+    keep_best = crop_store is not None and crop_store.keep
+    for detection in detections.boxes.data.tolist():
+        x1, y1, x2, y2, score, class_id = detection
+        if int(class_id) in VEHICLES:
+            detections_.append([x1, y1, x2, y2, score])
+            vehicles.append(detection)
+            if annotations is not None:
+                annotations.labeled_box((x1, y1, x2, y2), f"Vehicle: {int(class_id)}", (255, 0, 0))
+            if not keep_best:
+                vehicle_crop = frame[int(y1):int(y2), int(x1):int(x2)]
+                vehicle_image_path = os.path.join(vehicle_output_folder, f"frame_{frame_nmr:04d}_vehicle_{int(class_id)}_{int(score*100)}.jpg")
+                save_crop(vehicle_image_path, vehicle_crop, crop_store)
+
+    try:
+        with timer.stage('tracking'):
+            track_ids = mot_tracker.update(np.asarray(detections_))
+    except Exception as e:
+        print(f"Error during vehicle tracking: {e}")
+        track_ids = []
+
+    if keep_best:
+        save_track_crops(frame, frame_nmr, vehicles, track_ids, vehicle_output_folder, crop_store)
+
+    if license_plates is None:
+        with timer.stage('plate detection'):
+            license_plates = detect_plates_in_rois(frame, track_ids, license_plate_detector, roi_size)
+    else:
+        license_plates = license_plates.boxes.data.tolist()
+
+    assignments, unassigned = get_cars(license_plates, track_ids)
+    if counts is not None:
+        counts['unassigned plates'] += len(unassigned)
+
+    for license_plate, (xcar1, ycar1, xcar2, ycar2, car_id) in zip(license_plates, assignments):
+        x1, y1, x2, y2, score, class_id = license_plate
+
+        if car_id != -1:
+            license_plate_crop = frame[int(y1):int(y2), int(x1):int(x2), :]
+
+            plate_image_path = os.path.join(plate_output_folder, f"frame_{frame_nmr:04d}_plate_{car_id}_{int(score*100)}.jpg")
+            save_crop(plate_image_path, license_plate_crop, crop_store, car_id, score, frame_nmr)
+
+            frame_results[car_id] = {
+                'car': {'bbox': [xcar1, ycar1, xcar2, ycar2]},
+                'license_plate': {
+                    'bbox': [x1, y1, x2, y2],
+                    'bbox_score': score
+                }
+            }
+            if ocr_scheduler is not None and not ocr_scheduler.should_read(car_id, license_plate_crop):
+                if ocr_pool is not None:
+                    frame_results[car_id]['license_plate']['text_future'] = ocr_scheduler.result_future(car_id)
+                    license_plate_label = '...'
+                else:
+                    license_plate_text, license_plate_text_score = ocr_scheduler.result(car_id)
+                    frame_results[car_id]['license_plate']['text'] = license_plate_text
+                    frame_results[car_id]['license_plate']['text_score'] = license_plate_text_score
+                    license_plate_label = license_plate_text
+            elif ocr_pool is not None:
+                text_future = ocr_pool.submit(read_plate_crop, license_plate_crop.copy())
+                if ocr_scheduler is not None:
+                    ocr_scheduler.add_pending(car_id, text_future, score)
+                frame_results[car_id]['license_plate']['text_future'] = text_future
+                license_plate_label = '...'
+            else:
+                license_plate_text, license_plate_text_score = read_plate_crop(license_plate_crop)
+                if ocr_scheduler is not None:
+                    ocr_scheduler.add_reading(car_id, license_plate_text, license_plate_text_score, score)
+                frame_results[car_id]['license_plate']['text'] = license_plate_text
+                frame_results[car_id]['license_plate']['text_score'] = license_plate_text_score
+                license_plate_label = license_plate_text
+
+            if annotations is not None:
+                annotations.labeled_box((x1, y1, x2, y2), f"LP: {license_plate_label}", (0, 255, 0))
+
+    if crop_store is not None:
+        crop_store.flush_idle(frame_nmr)
+
+    return frame_results
+
+def detect_and_track(video_path, output_csv_path, vehicle_output_folder, plate_output_folder, batch_size=1,
+                     threaded=False, queue_size=8, ocr_workers=2, report_every=100, plate_roi=False, roi_size=320,
+                     schedule_ocr=False, flush_every=100, fsync_interval=None, preview_every=1, crop_keep=0,
+                     crop_archive=False, crop_shard_size=0, session=None, start_frame=0,
+                     end_frame=None, max_stride=1, min_changed=0.001, checkpoint_every=0, resume=False):
     """
     Performs vehicle and license plate detection and tracking on a video.
+
+    Frames are decoded into batches of batch_size and both YOLO models run once
+    per batch; the tracker still sees the per-frame results in frame order.
+
+    With threaded=True decoding and inference each run on their own thread behind
+    a queue of queue_size items, OCR runs on a pool of ocr_workers threads and
+    crops are written by a background writer. Queue depths are printed every
+    report_every frames; a stage whose queue stays full is waiting on the stage after it.
+
+    With plate_roi=True the license plate detector only sees the tracked vehicle
+    boxes, letterboxed to roi_size, instead of the full frame.
+
+    With schedule_ocr=True each track is read only a few times (see
+    util.OcrScheduler) and the accepted text is reused for its later frames.
+
+    Rows are streamed to output_csv_path as frames finish; the file is flushed
+    every flush_every frames and fsynced every fsync_interval seconds if set.
+    An output path ending in .npz is written in the columnar format instead.
+
+    Crops are written by a background writer (see crop_store.CropStore). With
+    crop_keep=K only the K best vehicle and plate crops of each track are saved,
+    and with crop_archive=True they go into tar files of crop_shard_size crops
+    (0 for a single file) in each output folder instead of one file per crop.
+
+    Every preview_every-th frame is annotated and shown in a preview window,
+    where 'q' stops processing. With preview_every=0 the loop runs headless:
+    no window is opened and nothing is drawn into the frames.
+
+    Only frames [start_frame, end_frame) are processed; end_frame=None reads to
+    the end of the video (see sharding.detect_and_track_sharded).
+
+    With max_stride > 1 frames without motion are skipped entirely, so at most
+    max_stride - 1 frames in a row (see util.MotionGate). The tracker is not
+    updated on skipped frames, so its Kalman prediction bridges them on the next
+    inferred frame. Skipped frame numbers are saved next to output_csv_path
+    (see util.skipped_frames_path) for data_processor to interpolate.
+
+    Pass a models.ModelSession to reuse already loaded models across videos;
+    without one the detectors are loaded for this call only.
+
+    With checkpoint_every > 0 the results are synced to disk every
+    checkpoint_every frames, and the last processed frame and the tracker state
+    are saved next to output_csv_path (see checkpoint.checkpoint_path). With
+    resume=True a run starts after the frame of that checkpoint, keeping the
+    results written up to it. The checkpoint is removed once the video has been
+    processed to the end.
     """
-    results = {}
+    checkpoint_file = checkpoint_path(output_csv_path)
+    state = load_checkpoint(checkpoint_file) if resume else None
+    if resume and state is None:
+        print(f"No checkpoint found at {checkpoint_file}, starting from the beginning")
+
     mot_tracker = Sort()
+    motion_gate = MotionGate(max_stride, min_changed) if max_stride > 1 else None
+    ocr_scheduler = OcrScheduler() if schedule_ocr else None
+    skipped = []
+    writer_options = {}
+    if state is not None:
+        mot_tracker = state['tracker']
+        KalmanBoxTracker.count = state['track_count']
+        start_frame = state['frame_nmr'] + 1
+        skipped = state['skipped']
+        if motion_gate is not None and state['motion_gate'] is not None:
+            motion_gate = state['motion_gate']
+        if ocr_scheduler is not None and state['ocr_scheduler'] is not None:
+            ocr_scheduler = state['ocr_scheduler']
+        writer_options['resume_offset'] = state['results_offset']
+        print(f"Resuming from frame {start_frame}")
 
-    coco_model = YOLO('yolov8n.pt')
-    license_plate_detector = YOLO('license_plate_detector.pt')
+    if session is None:
+        session = ModelSession(ocr=False, warmup=False, verbose=False)
+    coco_model = session.coco_model
+    license_plate_detector = session.license_plate_detector
 
     if not os.path.exists(vehicle_output_folder):
         os.makedirs(vehicle_output_folder)
@@ -24,67 +398,94 @@ def detect_and_track(video_path, output_csv_path, vehicle_output_folder, plate_o
         os.makedirs(plate_output_folder)
 
     cap = cv2.VideoCapture(video_path)
-    vehicles = [2, 3, 5, 7]
 
-    frame_nmr = -1
-    ret = True
-    while ret:
-        frame_nmr += 1
-        ret, frame = cap.read()
-        if ret:
-            results[frame_nmr] = {}
-            detections = coco_model(frame)[0]
-            detections_ = []
-            for detection in detections.boxes.data.tolist():
-                x1, y1, x2, y2, score, class_id = detection
-                if int(class_id) in vehicles:
-                    detections_.append([x1, y1, x2, y2, score])
-                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 2)
-                    cv2.putText(frame, f"Vehicle: {int(class_id)}", (int(x1), int(y1) - 10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-                    vehicle_crop = frame[int(y1):int(y2), int(x1):int(x2)]
-                    vehicle_image_path = os.path.join(vehicle_output_folder, f"frame_{frame_nmr:04d}_vehicle_{int(class_id)}_{int(score*100)}.jpg")
-                    cv2.imwrite(vehicle_image_path, vehicle_crop)
-
-            try:
-                track_ids = mot_tracker.update(np.asarray(detections_))
-            except Exception as e:
-                print(f"Error during vehicle tracking: {e}")
-                track_ids = []
-
-            license_plates = license_plate_detector(frame)[0]
-            for license_plate in license_plates.boxes.data.tolist():
-                x1, y1, x2, y2, score, class_id = license_plate
-                xcar1, ycar1, xcar2, ycar2, car_id = get_car(license_plate, track_ids)
-
-                if car_id != -1:
-                    license_plate_crop = frame[int(y1):int(y2), int(x1):int(x2), :]
-                    license_plate_crop_gray = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
-                    _, license_plate_crop_thresh = cv2.threshold(license_plate_crop_gray, 64, 255, cv2.THRESH_BINARY_INV)
-                    license_plate_text, license_plate_text_score = read_license_plate(license_plate_crop_thresh)
-                    license_plate_text, license_plate_text_score = read_license_plate(license_plate_crop)
-
-                    plate_image_path = os.path.join(plate_output_folder, f"frame_{frame_nmr:04d}_plate_{car_id}_{int(score*100)}.jpg")
-                    cv2.imwrite(plate_image_path, license_plate_crop)
-
-                    results[frame_nmr][car_id] = {
-                        'car': {'bbox': [xcar1, ycar1, xcar2, ycar2]},
-                        'license_plate': {
-                            'bbox': [x1, y1, x2, y2],
-                            'text': license_plate_text if license_plate_text else 'Unknown',
-                            'bbox_score': score,
-                            'text_score': license_plate_text_score if license_plate_text else 0
-                        }
-                    }
-
-                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                    cv2.putText(frame, f"LP: {license_plate_text if license_plate_text else 'Unknown'}", 
-                                (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-            cv2.imshow('Vehicle and License Plate Detection', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+    frames = read_frames(cap, start_frame, end_frame)
+    gate_states = {} if motion_gate is not None and checkpoint_every else None
+    if motion_gate is not None:
+        frames = skip_static_frames(frames, motion_gate, skipped, gate_states)
+    stages = []
+    ocr_pool = None
+    if threaded:
+        frames = Stage('decode', frames, maxsize=queue_size * batch_size)
+        stages.append(frames)
+    batches = infer_batches(iter_batches(frames, batch_size), coco_model,
+                            None if plate_roi else license_plate_detector)
+    if threaded:
+        batches = Stage('inference', batches, maxsize=queue_size)
+        ocr_pool = WorkerPool('ocr', workers=ocr_workers, maxsize=queue_size * 4)
+        stages.extend([batches, ocr_pool])
+    crop_store = CropStore(keep=crop_keep, archive=crop_archive, shard_size=crop_shard_size, maxsize=queue_size * 8)
+    stages.append(crop_store)
+
+    writer = open_result_writer(output_csv_path, flush_every=flush_every, fsync_interval=fsync_interval,
+                                **writer_options)
+    pending = deque()
+    counts = Counter()
+    last_checkpoint = start_frame - 1
+    finished = False
+
+    try:
+        stopped = False
+        for batch in batches:
+            for frame_nmr, frame, detections, license_plates in batch:
+                preview = preview_every and frame_nmr % preview_every == 0
+                annotations = FrameAnnotations() if preview else None
+                pending.append((frame_nmr, track_frame(frame, frame_nmr, detections, license_plates, mot_tracker,
+                                                       vehicle_output_folder, plate_output_folder,
+                                                       annotations=annotations,
+                                                       ocr_pool=ocr_pool, crop_store=crop_store,
+                                                       license_plate_detector=license_plate_detector if plate_roi else None,
+                                                       roi_size=roi_size, ocr_scheduler=ocr_scheduler,
+                                                       counts=counts)))
+                write_finished_frames(pending, writer)
+                gate_state = gate_states.pop(frame_nmr) if gate_states is not None else None
+
+                if checkpoint_every and frame_nmr - last_checkpoint >= checkpoint_every:
+                    write_finished_frames(pending, writer, wait=True)
+                    if ocr_scheduler is not None:
+                        # Readings are added by future callbacks, which may run after the result is set
+                        ocr_scheduler.wait_idle()
+                    save_checkpoint(checkpoint_file, {
+                        'frame_nmr': frame_nmr,
+                        'results_offset': writer.sync(),
+                        'tracker': mot_tracker,
+                        'track_count': KalmanBoxTracker.count,
+                        'skipped': [n for n in skipped if n <= frame_nmr],
+                        'motion_gate': gate_state,
+                        'ocr_scheduler': ocr_scheduler
+                    })
+                    last_checkpoint = frame_nmr
+
+                if threaded and frame_nmr % report_every == 0:
+                    print(f"Frame {frame_nmr} queue depths: {format_queue_depths(stages)}")
+
+                if preview:
+                    # Crops still being written or read were copied by track_frame
+                    cv2.imshow('Vehicle and License Plate Detection', annotations.draw(frame))
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        stopped = True
+                        break
+            if stopped:
                 break
+        finished = not stopped
+    finally:
+        for stage in reversed(stages):
+            stage.close()
+        write_finished_frames(pending, writer, wait=True)
+        writer.close()
+
+    if finished:
+        remove_checkpoint(checkpoint_file)
+
+    if counts['unassigned plates']:
+        print(f"{counts['unassigned plates']} license plate(s) were outside every tracked vehicle")
+
+    if max_stride > 1:
+        write_skipped_frames(output_csv_path, skipped)
+        print(f"Skipped inference on {len(skipped)} frame(s) without motion")
+    elif os.path.exists(skipped_frames_path(output_csv_path)):
+        os.remove(skipped_frames_path(output_csv_path))
 
     cap.release()
-    cv2.destroyAllWindows()
-    write_csv(results, output_csv_path)
+    if preview_every:
+        cv2.destroyAllWindows()
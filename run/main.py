@@ -1,7 +1,6 @@
-import os
-from detector import detect_and_track
-from data_processor import process_missing_data
-from visualizer import generate_video
+from util import use_ocr_server
+from models import ModelSession
+from batch import process_video, run_batch
 
 def main():
     # --- Configuration ---
@@ -9,37 +8,87 @@ def main():
     video_path = ""  # Example: 'videos/demo8.mp4'
     output_folder = "" # Example: 'results'
 
+    # Batch mode: a directory of videos, or a manifest file with one video path per line.
+    # Each video is written to its own folder under output_folder.
+    batch_input = ""  # Example: 'videos/'
+    # Number of worker processes in batch mode, each with its own models
+    batch_workers = 2
+
+    # Number of frames passed to the YOLO models per inference call
+    batch_size = 1
+    # Run decoding, inference, OCR and crop writing on separate threads
+    threaded = False
+    ocr_workers = 2
+    # Detect plates only inside tracked vehicle boxes, letterboxed to roi_size
+    plate_roi = False
+    roi_size = 320
+    # Read each tracked plate only a few times instead of on every frame
+    schedule_ocr = False
+    # Address of a shared OCR process started with `python ocr_server.py` (None loads OCR here).
+    # The server and this run read their shared secret from OCR_SERVER_AUTHKEY or OCR_SERVER_AUTHKEY_FILE.
+    ocr_server = None  # Example: 'localhost:6010'
+    # Show every Nth frame in a preview window while detecting (0 runs headless)
+    preview_every = 1
+    # Skip inference on frames without motion, running at least every max_stride frames (1 disables)
+    max_stride = 1
+    # Fraction of changed pixels in the downscaled frame that counts as motion
+    min_changed = 0.001
+
+    # Save only the crop_keep best crops of each track (0 saves every crop)
+    crop_keep = 0
+    # Pack crops into tar files of crop_shard_size crops (0 for one file per folder)
+    crop_archive = False
+    crop_shard_size = 0
+
+    # Save a checkpoint of detection every checkpoint_every frames (0 disables)
+    checkpoint_every = 0
+    # Continue detection from the last checkpoint instead of starting over
+    resume = False
+
+    # File format of the raw and processed results: 'csv' or 'npz' (columnar)
+    results_format = 'csv'
+
+    # Add interpolated rows for detection gaps of up to max_gap frames (0 disables)
+    max_gap = 0
+
+    # Split detection of one long video into this many overlapping frame ranges run in parallel
+    detect_shards = 1
+    # Frames each shard reads before its own range, used to match tracks across shards
+    shard_overlap = 30
+
+    # Number of processes used to render the output video
+    render_workers = 1
+
+    # Decode the video once and run all three steps in a single pass
+    fused_pipeline = False
+    # Number of frames held back for interpolation in the fused pipeline
+    window_size = 30
+
     # --- End of Configuration ---
 
+    options = dict(batch_size=batch_size, threaded=threaded, ocr_workers=ocr_workers, plate_roi=plate_roi,
+                   roi_size=roi_size, schedule_ocr=schedule_ocr, preview_every=preview_every, crop_keep=crop_keep,
+                   crop_archive=crop_archive, crop_shard_size=crop_shard_size, results_format=results_format,
+                   max_gap=max_gap, render_workers=render_workers, fused_pipeline=fused_pipeline,
+                   window_size=window_size, detect_shards=detect_shards, shard_overlap=shard_overlap,
+                   ocr_server=ocr_server, max_stride=max_stride, min_changed=min_changed,
+                   checkpoint_every=checkpoint_every, resume=resume)
+
+    if batch_input and output_folder:
+        run_batch(batch_input, output_folder, options, workers=batch_workers, ocr_server=ocr_server)
+        return
+
     if not video_path or not output_folder:
-        print("Please fill in the video_path and output_folder variables in main.py")
+        print("Please fill in the video_path (or batch_input) and output_folder variables in main.py")
         return
 
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Define output file paths
-    raw_csv_path = os.path.join(output_folder, 'raw_results.csv')
-    processed_csv_path = os.path.join(output_folder, 'processed_results.csv')
-    output_video_path = os.path.join(output_folder, 'output_video.mp4')
-    vehicle_output_folder = os.path.join(output_folder, 'detected_vehicles')
-    plate_output_folder = os.path.join(output_folder, 'detected_plates')
-
-    # 1. Run detection and tracking
-    print("Step 1: Running detection and tracking...")
-    detect_and_track(video_path, raw_csv_path, vehicle_output_folder, plate_output_folder)
-    print("Detection and tracking complete.")
-
-    # 2. Process missing data
-    print("\nStep 2: Processing and interpolating data...")
-    process_missing_data(raw_csv_path, processed_csv_path)
-    print("Data processing complete.")
-
-    # 3. Generate visualized video
-    print("\nStep 3: Generating visualized video...")
-    generate_video(processed_csv_path, video_path, output_video_path)
-    print("Visualization complete.")
+    if ocr_server:
+        use_ocr_server(ocr_server)
+
+    # Load the models once and warm them up
+    session = ModelSession(ocr=not ocr_server)
+
+    process_video(video_path, output_folder, session, **options)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+
+import time
+from ultralytics import YOLO
+import numpy as np
+from util import get_reader, read_license_plate, use_ocr_server
+
+VEHICLE_MODEL_PATH = 'yolov8n.pt'
+PLATE_MODEL_PATH = 'license_plate_detector.pt'
+
+class ModelSession:
+    """
+    Holds the vehicle detector, the license plate detector and the OCR reader.
+
+    Create one session and pass it to detect_and_track (or run_fused_pipeline)
+    for every video, so the models are loaded only once. With warmup=True each
+    model first runs on a dummy input of warmup_size pixels, so the first video
+    does not pay for lazy initialization. With ocr=False the OCR reader is left
+    to be created on first use, e.g. when a shared OCR server is used instead.
+
+    Load and warmup times are kept in timings and printed by report.
+    """
+    def __init__(self, vehicle_model_path=VEHICLE_MODEL_PATH, plate_model_path=PLATE_MODEL_PATH, ocr=True,
+                 warmup=True, warmup_size=640, verbose=True):
+        self.timings = {}
+
+        self.coco_model = self._timed('load vehicle model', YOLO, vehicle_model_path)
+        self.license_plate_detector = self._timed('load plate model', YOLO, plate_model_path)
+        self.reader = self._timed('load OCR reader', get_reader) if ocr else None
+
+        if warmup:
+            self.warmup(warmup_size)
+        if verbose:
+            self.report()
+
+    def _timed(self, name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.timings[name] = time.perf_counter() - start
+        return result
+
+    def warmup(self, size=640):
+        """
+        Runs every loaded model once on a blank input.
+        """
+        frame = np.zeros((size, size, 3), dtype=np.uint8)
+        self._timed('warmup vehicle model', self.coco_model, frame)
+        self._timed('warmup plate model', self.license_plate_detector, frame)
+        if self.reader is not None:
+            self._timed('warmup OCR reader', read_license_plate, np.zeros((48, 160, 3), dtype=np.uint8))
+
+    def report(self):
+        print("Model session: " + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()))
+
+# Models of the current pool worker process, loaded once by init_worker
+_worker_session = None
+
+def init_worker(ocr_server=None):
+    """
+    Process pool initializer that loads the models of a worker once (see worker_session).
+
+    With an ocr_server address the worker reads plates through that server
+    instead of loading its own OCR reader.
+    """
+    global _worker_session
+    if ocr_server:
+        use_ocr_server(ocr_server)
+    _worker_session = ModelSession(ocr=not ocr_server)
+
+def worker_session():
+    return _worker_session
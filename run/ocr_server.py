@@ -0,0 +1,123 @@
+
+import argparse
+import ipaddress
+import os
+import socket
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from util import get_reader, read_license_plate_local
+
+DEFAULT_ADDRESS = 'localhost:6010'
+# Shared secret of the server and its clients, given directly or as the path of a file holding it
+AUTHKEY_ENV = 'OCR_SERVER_AUTHKEY'
+AUTHKEY_FILE_ENV = 'OCR_SERVER_AUTHKEY_FILE'
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+def load_authkey():
+    """
+    Returns the shared secret from OCR_SERVER_AUTHKEY or the file named by
+    OCR_SERVER_AUTHKEY_FILE, or None if neither is set.
+
+    Connections exchange pickles, so anyone holding the key can run code in the
+    server; it must not be a value committed to the repository.
+    """
+    key = os.environ.get(AUTHKEY_ENV)
+    if not key and os.environ.get(AUTHKEY_FILE_ENV):
+        with open(os.environ[AUTHKEY_FILE_ENV], encoding='utf-8') as f:
+            key = f.read().strip()
+    return key.encode('utf-8') if key else None
+
+def is_loopback(host):
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback for info in socket.getaddrinfo(host, None))
+    except (socket.gaierror, ValueError):
+        return False
+
+def handle_connection(conn):
+    """
+    Answers read requests from one client until it disconnects.
+    """
+    with conn:
+        while True:
+            try:
+                crop = conn.recv()
+            except EOFError:
+                return
+            # The reader is shared by all connections (see util.get_reader)
+            conn.send(read_license_plate_local(crop))
+
+def serve(address=DEFAULT_ADDRESS, allow_remote=False):
+    """
+    Runs a persistent OCR process that pipeline runs can share.
+
+    The EasyOCR model is loaded once at startup. Each client connection is served
+    on its own thread; see OcrClient and util.use_ocr_server for the client side.
+    The server refuses to start without a shared secret (see load_authkey), and
+    only listens on a non-loopback address if allow_remote is set.
+    """
+    authkey = load_authkey()
+    if authkey is None:
+        print(f"Error: set {AUTHKEY_ENV} or {AUTHKEY_FILE_ENV} to a shared secret before starting the OCR server")
+        return False
+    host, port = parse_address(address)
+    if not allow_remote and not is_loopback(host):
+        print(f"Error: {address} is not a loopback address; pass --allow-remote to accept remote clients")
+        return False
+
+    start = time.time()
+    get_reader()
+    print(f"OCR reader loaded in {time.time() - start:.1f}s")
+
+    with Listener((host, port), authkey=authkey) as listener:
+        print(f"OCR server listening on {address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+
+class OcrClient:
+    """
+    Sends license plate crops to an OCR server and returns its readings.
+
+    Each thread gets its own connection, so an OCR worker pool can keep several
+    requests in flight. If the server cannot be reached, reading falls back to
+    the local reader of this process.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.address = address
+        self._local = threading.local()
+        self._authkey = load_authkey()
+        self._failed = self._authkey is None
+        if self._failed:
+            print(f"Error: {AUTHKEY_ENV} or {AUTHKEY_FILE_ENV} is not set. Using the local reader instead.")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(parse_address(self.address), authkey=self._authkey)
+            self._local.conn = conn
+        return conn
+
+    def read_license_plate(self, license_plate_crop):
+        if not self._failed:
+            try:
+                conn = self._connection()
+                conn.send(license_plate_crop)
+                return conn.recv()
+            except (OSError, EOFError, AuthenticationError) as e:
+                self._local.conn = None
+                self._failed = True
+                print(f"Error reaching OCR server at {self.address}: {e}. Using the local reader instead.")
+        return read_license_plate_local(license_plate_crop)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared OCR server for pipeline runs.")
+    parser.add_argument('address', nargs='?', default=DEFAULT_ADDRESS, help="host:port to listen on")
+    parser.add_argument('--allow-remote', action='store_true', help="allow listening on a non-loopback address")
+    args = parser.parse_args()
+    sys.exit(0 if serve(args.address, args.allow_remote) else 1)
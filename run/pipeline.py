@@ -0,0 +1,139 @@
+
+import os
+from collections import Counter, deque
+import cv2
+from detector import process_frame
+from util import open_result_writer, OcrScheduler, PlateConsensus
+from crop_store import CropStore
+from models import ModelSession
+from visualizer import draw_license_plate, update_license_crop
+from sort.sort import Sort
+from timing import timer
+
+def interpolate_entry(prev_entry, next_entry, ratio):
+    """
+    Builds a synthetic entry for a frame between two observations of the same car.
+    """
+    def lerp(a, b):
+        return [a_ + ratio * (b_ - a_) for a_, b_ in zip(a, b)]
+
+    return {
+        'car': {'bbox': lerp(prev_entry['car']['bbox'], next_entry['car']['bbox'])},
+        'license_plate': {
+            'bbox': lerp(prev_entry['license_plate']['bbox'], next_entry['license_plate']['bbox']),
+            'text': 'Unknown',
+            'bbox_score': 0,
+            'text_score': 0
+        }
+    }
+
+def run_fused_pipeline(video_path, raw_csv_path, processed_csv_path, output_video_path,
+                       vehicle_output_folder, plate_output_folder, window_size=30, schedule_ocr=False,
+                       crop_keep=0, crop_archive=False, crop_shard_size=0, session=None):
+    """
+    Runs detection, tracking, interpolation and rendering in a single decode pass.
+
+    Decoded frames are held in a look-behind window of window_size frames. When a
+    car reappears within the window, the frames it was missing from are filled
+    by linear interpolation before they are rendered and written out.
+
+    With schedule_ocr=True each track is read only a few times (see util.OcrScheduler).
+    The rendered plate text is the running per-character consensus of each
+    track's readings (see util.PlateConsensus); with the scheduler this is the
+    scheduler's own consensus, so reused readings are not counted again.
+
+    Crops are saved as in detector.detect_and_track (see crop_store.CropStore),
+    and the models come from session if one is given.
+    """
+    mot_tracker = Sort()
+
+    if session is None:
+        session = ModelSession(ocr=False, warmup=False, verbose=False)
+    coco_model = session.coco_model
+    license_plate_detector = session.license_plate_detector
+
+    if not os.path.exists(vehicle_output_folder):
+        os.makedirs(vehicle_output_folder)
+
+    if not os.path.exists(plate_output_folder):
+        os.makedirs(plate_output_folder)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error loading video: {video_path}")
+        return
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
+
+    raw_writer = open_result_writer(raw_csv_path)
+    processed_writer = open_result_writer(processed_csv_path)
+    license_plate = {}
+    last_seen = {}
+    window = deque()
+    ocr_scheduler = OcrScheduler() if schedule_ocr else None
+    counts = Counter()
+    consensus = ocr_scheduler.consensus if ocr_scheduler is not None else PlateConsensus()
+    crop_store = CropStore(keep=crop_keep, archive=crop_archive, shard_size=crop_shard_size)
+
+    def render(buffered_nmr, buffered_frame, buffered_results):
+        with timer.stage('render'):
+            for car_id, entry in buffered_results.items():
+                if car_id in license_plate:
+                    consensus_text, _ = consensus.best(car_id)
+                    if consensus_text == 'Unknown':
+                        consensus_text = license_plate[car_id]['license_plate_number']
+                    draw_license_plate(buffered_frame, entry['license_plate']['bbox'],
+                                       license_plate[car_id]['license_crop'], consensus_text)
+            out.write(buffered_frame)
+        with timer.stage('results write'):
+            processed_writer.write_frame(buffered_nmr, buffered_results)
+
+    frame_nmr = -1
+    while True:
+        with timer.stage('decode'):
+            ret, frame = cap.read()
+        if not ret:
+            break
+        frame_nmr += 1
+
+        frame_results = process_frame(frame, frame_nmr, coco_model, license_plate_detector, mot_tracker,
+                                      vehicle_output_folder, plate_output_folder, annotate=False,
+                                      ocr_scheduler=ocr_scheduler, crop_store=crop_store, counts=counts)
+        with timer.stage('results write'):
+            raw_writer.write_frame(frame_nmr, frame_results)
+        window.append((frame_nmr, frame, dict(frame_results)))
+
+        for car_id, entry in frame_results.items():
+            update_license_crop(license_plate, car_id, frame, entry['license_plate']['bbox'],
+                                entry['license_plate']['text'], entry['license_plate']['text_score'])
+            if ocr_scheduler is None:
+                consensus.add(car_id, entry['license_plate']['text'], entry['license_plate']['text_score'],
+                              entry['license_plate']['bbox_score'])
+
+            if car_id in last_seen:
+                prev_nmr, prev_entry = last_seen[car_id]
+                gap = frame_nmr - prev_nmr
+                if gap > 1 and prev_nmr >= window[0][0]:
+                    for missing_nmr in range(prev_nmr + 1, frame_nmr):
+                        missing_results = window[missing_nmr - window[0][0]][2]
+                        missing_results[car_id] = interpolate_entry(prev_entry, entry, (missing_nmr - prev_nmr) / gap)
+            last_seen[car_id] = (frame_nmr, entry)
+
+        if len(window) > window_size:
+            render(*window.popleft())
+
+    while window:
+        render(*window.popleft())
+
+    crop_store.close()
+    out.release()
+    cap.release()
+    raw_writer.close()
+    processed_writer.close()
+    if counts['unassigned plates']:
+        print(f"{counts['unassigned plates']} license plate(s) were outside every tracked vehicle")
+    print(f"Processing complete. Video saved to {output_video_path}.")
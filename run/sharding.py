@@ -0,0 +1,176 @@
+
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import pandas as pd
+from detector import detect_and_track
+from data_processor import load_results, save_results
+from visualizer import find_keyframes, split_frame_ranges, plate_texts_by_car
+from util import (CAR_BBOX_COLUMNS, box_iou, read_skipped_frames, write_skipped_frames,
+                  skipped_frames_path)
+from models import init_worker, worker_session
+from sort.sort import KalmanBoxTracker
+from timing import timer
+
+def plan_shards(frame_count, shards, overlap, keyframes=None):
+    """
+    Splits a video into shards of (read_start, own_start, own_end) frame numbers.
+
+    Each shard owns [own_start, own_end) and starts reading overlap frames
+    earlier, so its tracks are established by the time its own range begins and
+    can be matched to the previous shard's tracks. Starts are moved back onto
+    keyframes if they are known. The last shard's own_end is None.
+    """
+    plan = []
+    for own_start, own_end in split_frame_ranges(frame_count, shards, keyframes):
+        read_start = max(own_start - overlap, 0)
+        if keyframes and read_start:
+            read_start = max([k for k in keyframes if k <= read_start] or [0])
+        plan.append((read_start, own_start, own_end))
+    return plan
+
+def match_shard_ids(prev, shard, overlap_start, overlap_end, min_iou=0.5):
+    """
+    Maps the car_ids of shard to the car_ids of prev, using the frames both have read.
+
+    A pair of tracks gets a vote for every overlap frame in which their car boxes
+    overlap by at least min_iou, and pairs are matched greedily by votes. Pairs
+    whose consensus plate texts are both known and different are never matched.
+    A shard track without any box match is matched by plate text to a previous
+    track seen in the overlap, if exactly one has the same text.
+    """
+    in_overlap = lambda df: df[(df['frame_nmr'] >= overlap_start) & (df['frame_nmr'] < overlap_end)]
+    prev_overlap = in_overlap(prev)
+    shard_overlap = in_overlap(shard)
+
+    votes = defaultdict(int)
+    prev_frames = dict(list(prev_overlap.groupby('frame_nmr')))
+    for frame_nmr, rows in shard_overlap.groupby('frame_nmr'):
+        if frame_nmr not in prev_frames:
+            continue
+        prev_rows = prev_frames[frame_nmr]
+        ious = box_iou(rows[CAR_BBOX_COLUMNS].to_numpy(), prev_rows[CAR_BBOX_COLUMNS].to_numpy())
+        for i, j in zip(*np.nonzero(ious >= min_iou)):
+            votes[(rows['car_id'].iat[i], prev_rows['car_id'].iat[j])] += 1
+
+    prev_texts = plate_texts_by_car(prev)
+    shard_texts = plate_texts_by_car(shard)
+
+    def conflicts(local_id, global_id):
+        prev_text = prev_texts.get(global_id, 'Unknown')
+        shard_text = shard_texts.get(local_id, 'Unknown')
+        return prev_text != 'Unknown' and shard_text != 'Unknown' and prev_text != shard_text
+
+    mapping = {}
+    used = set()
+    for (local_id, global_id), _ in sorted(votes.items(), key=lambda item: -item[1]):
+        if local_id in mapping or global_id in used or conflicts(local_id, global_id):
+            continue
+        mapping[local_id] = global_id
+        used.add(global_id)
+
+    candidates = defaultdict(list)
+    for global_id in set(prev_overlap['car_id']) - used:
+        if prev_texts.get(global_id, 'Unknown') != 'Unknown':
+            candidates[prev_texts[global_id]].append(global_id)
+    for local_id in set(shard_overlap['car_id']) - set(mapping):
+        matches = candidates.get(shard_texts.get(local_id, 'Unknown'), [])
+        if len(matches) == 1 and matches[0] not in used:
+            mapping[local_id] = matches[0]
+            used.add(matches[0])
+    return mapping
+
+def stitch_shards(shard_paths, plan, output_path):
+    """
+    Merges the raw results of the shards into one file with global car_ids.
+
+    The first shard keeps its ids. Tracks of a later shard take the id of the
+    previous shard's track they match (see match_shard_ids) or a new id. Only the
+    rows of each shard's own frame range are kept.
+    """
+    merged = []
+    skipped = []
+    prev = None
+    next_id = 1
+    stitched = 0
+    for path, (read_start, own_start, own_end) in zip(shard_paths, plan):
+        shard = load_results(path)
+        local_ids = sorted(shard['car_id'].unique())
+        if prev is None:
+            mapping = {local_id: local_id for local_id in local_ids}
+        else:
+            mapping = match_shard_ids(prev, shard, read_start, own_start)
+            stitched += len(mapping)
+        next_id = max([next_id] + [global_id + 1 for global_id in mapping.values()])
+        for local_id in local_ids:
+            if local_id not in mapping:
+                mapping[local_id] = next_id
+                next_id += 1
+        shard['car_id'] = shard['car_id'].map(mapping).astype(np.int32)
+
+        owned = shard['frame_nmr'] >= own_start
+        if own_end is not None:
+            owned &= shard['frame_nmr'] < own_end
+        merged.append(shard[owned])
+        prev = shard
+
+        shard_skipped = read_skipped_frames(path)
+        if shard_skipped is not None:
+            owned = shard_skipped >= own_start
+            if own_end is not None:
+                owned &= shard_skipped < own_end
+            skipped.append(shard_skipped[owned])
+
+    results = pd.concat(merged, ignore_index=True)
+    save_results(results, output_path)
+    if skipped:
+        write_skipped_frames(output_path, np.concatenate(skipped))
+    print(f"Stitched {len(shard_paths)} shards into {output_path}: {stitched} tracks continued across "
+          f"shard boundaries, {results['car_id'].nunique()} cars")
+
+def run_shard(video_path, shard_path, vehicle_output_folder, plate_output_folder, read_start, own_end, options):
+    # Track IDs are local to the shard until they are stitched
+    KalmanBoxTracker.count = 0
+    timer.reset()
+    detect_and_track(video_path, shard_path, vehicle_output_folder, plate_output_folder, session=worker_session(),
+                     start_frame=read_start, end_frame=own_end, preview_every=0, **options)
+    return timer.snapshot()
+
+def detect_and_track_sharded(video_path, output_path, vehicle_output_folder, plate_output_folder, shards=4,
+                             overlap=30, ocr_server=None, **options):
+    """
+    Runs detect_and_track on overlapping frame ranges of one video in parallel.
+
+    Each of the shards runs in its own process with its own models and tracker.
+    Their raw results are stitched into output_path with globally consistent
+    car_ids (see stitch_shards). Crops are written to a shard_NNN subfolder per
+    shard and are named with the shard's local car_ids. The remaining options
+    are passed to detect_and_track.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error loading video: {video_path}")
+        return
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    plan = plan_shards(frame_count, shards, overlap, find_keyframes(video_path))
+    base, ext = os.path.splitext(output_path)
+    shard_paths = [f"{base}.shard{i:03d}{ext}" for i in range(len(plan))]
+
+    with ProcessPoolExecutor(max_workers=len(plan), initializer=init_worker, initargs=(ocr_server,)) as executor:
+        futures = [executor.submit(run_shard, video_path, shard_path,
+                                   os.path.join(vehicle_output_folder, f"shard_{i:03d}"),
+                                   os.path.join(plate_output_folder, f"shard_{i:03d}"),
+                                   read_start, own_end, options)
+                   for i, (shard_path, (read_start, _, own_end)) in enumerate(zip(shard_paths, plan))]
+        for future in futures:
+            timer.merge(future.result())
+
+    stitch_shards(shard_paths, plan, output_path)
+    for shard_path in shard_paths:
+        os.remove(shard_path)
+        if os.path.exists(skipped_frames_path(shard_path)):
+            os.remove(skipped_frames_path(shard_path))
@@ -0,0 +1,95 @@
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+class Stage:
+    """
+    Runs an iterable on a background thread and buffers its items in a bounded queue.
+
+    Iterating over the stage yields the items in the order they were produced. The
+    producer blocks while the queue is full, so a slow consumer throttles it.
+    """
+    def __init__(self, name, iterable, maxsize=8):
+        self.name = name
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(iterable,), name=name, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterable):
+        # KeyboardInterrupt and SystemExit are passed on too, so the consumer never waits forever
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._put(_DONE)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def close(self):
+        self._stop.set()
+        self.thread.join()
+
+class WorkerPool:
+    """
+    Thread pool that holds at most maxsize queued or running tasks.
+
+    submit blocks while the pool is full, which keeps memory bounded when the
+    workers fall behind the stage feeding them.
+    """
+    def __init__(self, name, workers=2, maxsize=32):
+        self.name = name
+        self.maxsize = maxsize
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, fn, *args):
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def depth(self):
+        return self._pending
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+def format_queue_depths(stages):
+    return ', '.join(f"{stage.name}={stage.depth()}/{stage.maxsize}" for stage in stages)
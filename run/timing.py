@@ -0,0 +1,115 @@
+
+import json
+import math
+import threading
+import time
+import numpy as np
+
+# Latency histogram bins: BINS_PER_DECADE log-spaced bins from 1 microsecond to 1000 seconds
+BINS_PER_DECADE = 20
+MIN_EXPONENT = -6
+BIN_COUNT = 9 * BINS_PER_DECADE + 1
+
+def bin_index(seconds):
+    if seconds <= 0:
+        return 0
+    return min(max(int((math.log10(seconds) - MIN_EXPONENT) * BINS_PER_DECADE), 0), BIN_COUNT - 1)
+
+def bin_upper_edge(index):
+    return 10 ** (MIN_EXPONENT + (index + 1) / BINS_PER_DECADE)
+
+class _StageContext:
+    __slots__ = ('timer', 'name', 'count', 'start')
+
+    def __init__(self, timer, name, count):
+        self.timer = timer
+        self.name = name
+        self.count = count
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.record(self.name, time.perf_counter() - self.start, self.count)
+
+class StageTimer:
+    """
+    Collects a latency histogram, count and total per pipeline stage.
+
+    Recording a sample costs one log10 and a list increment under a lock, so the
+    timer can stay enabled in production. Percentiles are read from the
+    histogram and are accurate to the bin width (about 12%).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, name, seconds, count=1):
+        index = bin_index(seconds / count)
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = {'histogram': [0] * BIN_COUNT, 'count': 0, 'total': 0.0, 'max': 0.0}
+            stats['histogram'][index] += count
+            stats['count'] += count
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds / count)
+
+    def stage(self, name, count=1):
+        """
+        Times the enclosed with block as count samples of stage name (e.g. a batch of frames).
+        """
+        return _StageContext(self, name, count)
+
+    def snapshot(self):
+        """
+        Returns a picklable copy of the collected stats, e.g. to send from a worker process.
+        """
+        with self._lock:
+            return {name: dict(stats, histogram=list(stats['histogram'])) for name, stats in self.stages.items()}
+
+    def merge(self, snapshot):
+        """
+        Adds the stats of a snapshot, e.g. one taken in a worker process.
+        """
+        with self._lock:
+            for name, other in snapshot.items():
+                stats = self.stages.setdefault(name, {'histogram': [0] * BIN_COUNT, 'count': 0, 'total': 0.0,
+                                                      'max': 0.0})
+                stats['histogram'] = [a + b for a, b in zip(stats['histogram'], other['histogram'])]
+                stats['count'] += other['count']
+                stats['total'] += other['total']
+                stats['max'] = max(stats['max'], other['max'])
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+
+    def summary(self):
+        """
+        Returns count, total and p50/p95/p99/max latency in milliseconds per stage.
+        """
+        summary = {}
+        for name, stats in self.snapshot().items():
+            cumulative = np.cumsum(stats['histogram'])
+            percentiles = {}
+            for p in (50, 95, 99):
+                index = int(np.searchsorted(cumulative, stats['count'] * p / 100))
+                # The upper bin edge can overshoot the largest sample
+                percentiles[f'p{p}_ms'] = round(min(bin_upper_edge(index), stats['max']) * 1000, 3)
+            summary[name] = dict({'count': stats['count'], 'total_s': round(stats['total'], 3),
+                                  'mean_ms': round(stats['total'] / stats['count'] * 1000, 3) if stats['count'] else 0},
+                                 **percentiles, max_ms=round(stats['max'] * 1000, 3))
+        return summary
+
+    def write_report(self, path, **info):
+        """
+        Writes the stage summary and any extra run information as JSON.
+        """
+        report = dict(info, stages=self.summary())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+# Timer shared by all stages of this process
+timer = StageTimer()
@@ -1,8 +1,18 @@
+import copy
+import os
 import string
-import easyocr
+import threading
+import time
+from concurrent.futures import Future
+import cv2
+import numpy as np
 
-# OCR 리더 초기화
-reader = easyocr.Reader(['ko'], gpu=False)
+# OCR 리더는 첫 read_license_plate 호출 때 생성합니다 (get_reader 참고)
+_reader = None
+_reader_lock = threading.Lock()
+
+# use_ocr_server 로 설정한 공유 OCR 프로세스 클라이언트
+_ocr_client = None
 
 # 한국 번호판의 유효한 문자 목록
 char_list = [
@@ -20,6 +30,120 @@ char_list = [
     '하', '허', '호'
 ]
 
+RESULT_COLUMNS = ['frame_nmr', 'car_id', 'car_bbox', 'license_plate_bbox', 'license_plate_bbox_score',
+                  'license_number', 'license_number_score']
+
+# 열 기반(.npz) 결과 파일에서 bbox 를 좌표별로 나눈 열 이름
+CAR_BBOX_COLUMNS = ['car_bbox_x1', 'car_bbox_y1', 'car_bbox_x2', 'car_bbox_y2']
+PLATE_BBOX_COLUMNS = ['license_plate_bbox_x1', 'license_plate_bbox_y1',
+                      'license_plate_bbox_x2', 'license_plate_bbox_y2']
+COLUMNAR_DTYPES = dict([('frame_nmr', np.int32), ('car_id', np.int32)] +
+                       [(column, np.float32) for column in CAR_BBOX_COLUMNS + PLATE_BBOX_COLUMNS] +
+                       [('license_plate_bbox_score', np.float32), ('license_number', np.str_),
+                        ('license_number_score', np.float32)])
+
+
+def format_result_row(frame_nmr, car_id, result):
+    """
+    결과 하나를 CSV 한 줄로 변환합니다.
+
+    Args:
+        frame_nmr (int): 프레임 번호.
+        car_id (int): 차량 ID.
+        result (dict): 'car' 와 'license_plate' 정보를 담은 결과.
+
+    Returns:
+        str: CSV 한 줄. 필요한 정보가 없으면 None.
+    """
+    if 'car' not in result.keys() or 'license_plate' not in result.keys() or \
+       'text' not in result['license_plate'].keys():
+        return None
+    return '{},{},{},{},{},{},{}\n'.format(frame_nmr,
+                                          car_id,
+                                          '[{} {} {} {}]'.format(*result['car']['bbox'][:4]),
+                                          '[{} {} {} {}]'.format(*result['license_plate']['bbox'][:4]),
+                                          result['license_plate']['bbox_score'],
+                                          result['license_plate']['text'],
+                                          result['license_plate']['text_score'])
+
+
+class CsvResultWriter:
+    """
+    프레임 결과를 처리되는 즉시 CSV 파일에 기록합니다.
+
+    결과 전체를 메모리에 모으지 않으므로 긴 영상에서도 메모리 사용량이 일정하고,
+    중간에 프로그램이 종료되어도 마지막으로 flush 된 프레임까지는 파일에 남습니다.
+
+    Args:
+        output_path (str): 출력 CSV 파일 경로.
+        flush_every (int): 몇 프레임마다 파일 버퍼를 flush 할지.
+        fsync_interval (float): 몇 초마다 디스크에 fsync 할지. None 이면 fsync 하지 않음.
+        resume_offset (int): 이어 쓸 파일 위치 (sync 의 반환값). 그 뒤의 내용은 잘라냄.
+    """
+
+    def __init__(self, output_path, flush_every=100, fsync_interval=None, resume_offset=None):
+        self.output_path = output_path
+        self.flush_every = flush_every
+        self.fsync_interval = fsync_interval
+        self.frames_written = 0
+        self.rows_written = 0
+        self._last_fsync = time.monotonic()
+        if resume_offset is not None:
+            self._file = open(output_path, 'r+', encoding='utf-8')
+            self._file.seek(resume_offset)
+            self._file.truncate()
+        else:
+            self._file = open(output_path, 'w', encoding='utf-8')
+            self._file.write(','.join(RESULT_COLUMNS) + '\n')
+
+    def write_frame(self, frame_nmr, frame_results):
+        """
+        한 프레임의 결과를 기록합니다.
+
+        Args:
+            frame_nmr (int): 프레임 번호.
+            frame_results (dict): car_id 별 결과.
+        """
+        for car_id, result in frame_results.items():
+            row = format_result_row(frame_nmr, car_id, result)
+            if row is not None:
+                self._file.write(row)
+                self.rows_written += 1
+
+        self.frames_written += 1
+        if self.frames_written % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        if self.fsync_interval is not None and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def sync(self):
+        """
+        지금까지의 행을 디스크에 기록하고, 이어 쓰기에 사용할 파일 위치를 반환합니다.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+        return self._file.tell()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        if self.fsync_interval is not None:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def write_csv(results, output_path):
     """
     Write the results to a CSV file.
@@ -28,34 +152,233 @@ def write_csv(results, output_path):
         results (dict): Dictionary containing the results.
         output_path (str): Path to the output CSV file.
     """
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write('{},{},{},{},{},{},{}\n'.format('frame_nmr', 'car_id', 'car_bbox',
-                                                'license_plate_bbox', 'license_plate_bbox_score', 'license_number',
-                                                'license_number_score'))
-
+    with CsvResultWriter(output_path) as writer:
         for frame_nmr in results.keys():
-            for car_id in results[frame_nmr].keys():
-                print(results[frame_nmr][car_id])
-                if 'car' in results[frame_nmr][car_id].keys() and \
-                   'license_plate' in results[frame_nmr][car_id].keys() and \
-                   'text' in results[frame_nmr][car_id]['license_plate'].keys():
-                    f.write('{},{},{},{},{},{},{}\n'.format(frame_nmr,
-                                                            car_id,
-                                                            '[{} {} {} {}]'.format(
-                                                                results[frame_nmr][car_id]['car']['bbox'][0],
-                                                                results[frame_nmr][car_id]['car']['bbox'][1],
-                                                                results[frame_nmr][car_id]['car']['bbox'][2],
-                                                                results[frame_nmr][car_id]['car']['bbox'][3]),
-                                                            '[{} {} {} {}]'.format(
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][0],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][1],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][2],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][3]),
-                                                            results[frame_nmr][car_id]['license_plate']['bbox_score'],
-                                                            results[frame_nmr][car_id]['license_plate']['text'],
-                                                            results[frame_nmr][car_id]['license_plate']['text_score'])
-                            )
-        f.close()
+            writer.write_frame(frame_nmr, results[frame_nmr])
+
+
+class NpzResultWriter:
+    """
+    프레임 결과를 열 기반 .npz 파일로 기록합니다.
+
+    frame_nmr, car_id 는 int32, bbox 좌표와 점수는 float32 열로 저장되므로
+    읽을 때 문자열을 해석할 필요가 없습니다. .npz 는 이어 쓰기가 불가능하므로
+    chunk_rows 행마다 지금까지의 행을 별도의 조각 파일 (npz_part_path 참고)로
+    저장하고, close 할 때 조각들을 하나의 .npz 파일로 합칩니다. 메모리에는 한
+    조각만 남고, 중간에 종료되어도 저장된 조각은 read_results_npz 로 읽을 수 있습니다.
+
+    Args:
+        output_path (str): 출력 .npz 파일 경로.
+        chunk_rows (int): 조각 파일 하나에 담을 행 수.
+        resume_offset (int): 이어 쓸 행 수 (sync 의 반환값). 그 뒤의 행은 버림.
+    """
+
+    def __init__(self, output_path, chunk_rows=10000, resume_offset=None, **kwargs):
+        self.output_path = output_path
+        self.chunk_rows = chunk_rows
+        self.frames_written = 0
+        self.rows_written = 0
+        self._parts = 0
+        self._rows = {column: [] for column in COLUMNAR_DTYPES}
+        self._closed = False
+
+        kept = None
+        if resume_offset is not None:
+            kept = {column: values[:resume_offset] for column, values in read_results_npz(output_path).items()}
+        remove_results_npz(output_path)
+        if kept is not None and resume_offset:
+            self._write_part(kept)
+            self.rows_written = resume_offset
+
+    def write_frame(self, frame_nmr, frame_results):
+        for car_id, result in frame_results.items():
+            if 'car' not in result.keys() or 'license_plate' not in result.keys() or \
+               'text' not in result['license_plate'].keys():
+                continue
+            self._rows['frame_nmr'].append(frame_nmr)
+            self._rows['car_id'].append(car_id)
+            for column, value in zip(CAR_BBOX_COLUMNS, result['car']['bbox']):
+                self._rows[column].append(value)
+            for column, value in zip(PLATE_BBOX_COLUMNS, result['license_plate']['bbox']):
+                self._rows[column].append(value)
+            self._rows['license_plate_bbox_score'].append(result['license_plate']['bbox_score'])
+            self._rows['license_number'].append(result['license_plate']['text'])
+            self._rows['license_number_score'].append(result['license_plate']['text_score'])
+            self.rows_written += 1
+
+        self.frames_written += 1
+        if len(self._rows['frame_nmr']) >= self.chunk_rows:
+            self.flush()
+
+    def _write_part(self, columns):
+        with open(npz_part_path(self.output_path, self._parts), 'wb') as f:
+            np.savez(f, **{column: np.asarray(columns[column], dtype=dtype)
+                           for column, dtype in COLUMNAR_DTYPES.items()})
+            f.flush()
+            os.fsync(f.fileno())
+        self._parts += 1
+
+    def flush(self):
+        if self._rows['frame_nmr']:
+            self._write_part(self._rows)
+            self._rows = {column: [] for column in COLUMNAR_DTYPES}
+
+    def sync(self):
+        """
+        지금까지의 행을 조각 파일로 디스크에 기록하고, 이어 쓰기에 사용할 행 수를 반환합니다.
+        """
+        self.flush()
+        return self.rows_written
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        parts = [npz_part_path(self.output_path, index) for index in range(self._parts)]
+        columns = read_npz_parts(parts)
+        # 합친 파일이 완성된 뒤에 조각을 지우므로 중간에 종료되어도 행을 잃지 않음
+        tmp_path = self.output_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, self.output_path)
+        for part in parts:
+            os.remove(part)
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_result_writer(output_path, **kwargs):
+    """
+    파일 확장자에 맞는 결과 기록기를 반환합니다 (.npz 는 열 기반, 그 외는 CSV).
+    """
+    if output_path.endswith('.npz'):
+        return NpzResultWriter(output_path, **kwargs)
+    return CsvResultWriter(output_path, **kwargs)
+
+
+def skipped_frames_path(results_path):
+    """
+    결과 파일 옆에 저장되는, 추론을 건너뛴 프레임 번호 파일의 경로를 반환합니다.
+    """
+    return os.path.splitext(results_path)[0] + '_skipped_frames.txt'
+
+
+def write_skipped_frames(results_path, frames):
+    """
+    추론을 건너뛴 프레임 번호를 한 줄에 하나씩 저장합니다.
+    """
+    np.savetxt(skipped_frames_path(results_path), np.asarray(frames, dtype=np.int64), fmt='%d')
+
+
+def read_skipped_frames(results_path):
+    """
+    건너뛴 프레임 번호 배열을 읽습니다. 파일이 없으면 None 을 반환합니다.
+    """
+    path = skipped_frames_path(results_path)
+    if not os.path.exists(path):
+        return None
+    # 건너뛴 프레임이 없으면 빈 파일이 저장됨
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.loadtxt(path, dtype=np.int64, ndmin=1)
+
+
+def write_results_npz(output_path, columns):
+    """
+    열 기반 결과를 .npz 파일로 저장합니다.
+
+    Args:
+        output_path (str): 출력 .npz 파일 경로.
+        columns (dict): COLUMNAR_DTYPES 의 열 이름별 배열.
+    """
+    np.savez(output_path, **{column: np.asarray(columns[column], dtype=dtype)
+                             for column, dtype in COLUMNAR_DTYPES.items()})
+
+
+def npz_part_path(output_path, index):
+    """
+    NpzResultWriter 가 기록 중에 저장하는 index 번째 조각 파일의 경로를 반환합니다.
+    """
+    return f"{os.path.splitext(output_path)[0]}.part{index:05d}.npz"
+
+
+def list_npz_parts(output_path):
+    parts = []
+    while os.path.exists(npz_part_path(output_path, len(parts))):
+        parts.append(npz_part_path(output_path, len(parts)))
+    return parts
+
+
+def read_npz_parts(paths):
+    """
+    조각 파일들의 열을 순서대로 이어 붙입니다.
+    """
+    chunks = []
+    for path in paths:
+        with np.load(path, allow_pickle=False) as data:
+            chunks.append({column: data[column] for column in COLUMNAR_DTYPES})
+    return {column: np.concatenate([chunk[column] for chunk in chunks]) if chunks
+            else np.asarray([], dtype=dtype)
+            for column, dtype in COLUMNAR_DTYPES.items()}
+
+
+def remove_results_npz(output_path):
+    """
+    .npz 결과 파일과 그 조각 파일들을 지웁니다.
+    """
+    for path in [output_path] + list_npz_parts(output_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def read_results_npz(input_path):
+    """
+    .npz 결과 파일을 읽습니다.
+
+    기록이 끝나지 않아 합친 파일이 없으면 NpzResultWriter 가 저장한 조각 파일들을
+    이어 붙여 반환합니다.
+
+    Args:
+        input_path (str): .npz 파일 경로.
+
+    Returns:
+        dict: 열 이름별 배열.
+    """
+    if not os.path.exists(input_path):
+        parts = list_npz_parts(input_path)
+        if parts:
+            return read_npz_parts(parts)
+    with np.load(input_path, allow_pickle=False) as data:
+        return {column: data[column] for column in data.files}
+
+
+def parse_bboxes(bboxes):
+    """
+    '[x1 y1 x2 y2]' 형식의 bbox 문자열들을 한 번에 (N, 4) 배열로 변환합니다.
+
+    Args:
+        bboxes (list): bbox 문자열 리스트. 쉼표로 구분된 형식도 허용합니다.
+
+    Returns:
+        numpy.ndarray: float 배열 (N, 4).
+    """
+    joined = ' '.join(bboxes).replace('[', ' ').replace(']', ' ').replace(',', ' ')
+    values = np.array(joined.split(), dtype=float)
+    if len(values) != 4 * len(bboxes):
+        raise ValueError("Every bounding box must have exactly 4 coordinates")
+    return values.reshape(-1, 4)
+
+
+def format_bboxes(bboxes):
+    """
+    (N, 4) 배열을 '[x1 y1 x2 y2]' 형식의 문자열 리스트로 변환합니다.
+    """
+    return ['[{} {} {} {}]'.format(*bbox) for bbox in np.asarray(bboxes).tolist()]
 
 
 def license_complies_format(text):
@@ -102,6 +425,54 @@ def format_license(text):
 
 
 
+def get_reader():
+    """
+    EasyOCR 리더를 반환하며, 처음 호출될 때 한 번만 생성합니다.
+
+    여러 스레드가 동시에 호출해도 리더는 하나만 만들어집니다. readtext 는 추론 중에
+    리더의 상태를 바꾸지 않으므로 OCR 워커 스레드와 OCR 서버의 연결들이 잠금 없이
+    같은 리더를 함께 사용합니다.
+
+    Returns:
+        easyocr.Reader: 한국어 OCR 리더.
+    """
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                import easyocr
+                _reader = easyocr.Reader(['ko'], gpu=False)
+    return _reader
+
+
+def set_reader(reader):
+    """
+    read_license_plate 가 사용할 리더를 지정합니다 (벤치마크용 대체 리더 등).
+
+    Args:
+        reader: readtext(image) 메서드를 가진 객체. None 이면 다음 호출 때 EasyOCR 리더를 생성합니다.
+    """
+    global _reader
+    with _reader_lock:
+        _reader = reader
+
+
+def use_ocr_server(address):
+    """
+    read_license_plate 가 로컬 리더 대신 공유 OCR 프로세스를 사용하도록 설정합니다.
+
+    Args:
+        address (str): ocr_server.py 가 대기 중인 주소 ('host:port').
+                       None 이면 다시 로컬 리더를 사용합니다.
+    """
+    global _ocr_client
+    if address is None:
+        _ocr_client = None
+        return
+    from ocr_server import OcrClient
+    _ocr_client = OcrClient(address)
+
+
 def read_license_plate(license_plate_crop):
     """
     번호판 이미지에서 텍스트를 인식합니다.
@@ -112,7 +483,16 @@ def read_license_plate(license_plate_crop):
     Returns:
         tuple: 번호판 텍스트와 신뢰도 점수.
     """
-    detections = reader.readtext(license_plate_crop)
+    if _ocr_client is not None:
+        return _ocr_client.read_license_plate(license_plate_crop)
+    return read_license_plate_local(license_plate_crop)
+
+
+def read_license_plate_local(license_plate_crop):
+    """
+    이 프로세스의 EasyOCR 리더로 번호판 텍스트를 인식합니다 (read_license_plate 참고).
+    """
+    detections = get_reader().readtext(license_plate_crop)
 
     for detection in detections:
         bbox, text, score = detection
@@ -135,10 +515,374 @@ def get_car(license_plate, vehicle_track_ids):
     Returns:
         tuple: 차량 좌표 (x1, y1, x2, y2)와 ID.
     """
-    x1, y1, x2, y2, score, class_id = license_plate
+    assignments, unassigned = get_cars([license_plate], vehicle_track_ids)
+    if len(unassigned):
+        return -1, -1, -1, -1, -1
+    return tuple(assignments[0])
+
+
+def get_cars(license_plates, vehicle_track_ids):
+    """
+    여러 번호판을 한 번에 차량에 배정합니다.
+
+    번호판을 완전히 포함하는 차량 중 가장 작은 차량(즉 IoU가 가장 큰 차량)에
+    배정하며, 모든 번호판과 차량 쌍을 NumPy 배열 연산으로 비교합니다.
+
+    Args:
+        license_plates (list): 번호판 좌표 리스트 (x1, y1, x2, y2, ...).
+        vehicle_track_ids (list): 차량 좌표와 ID 리스트 (x1, y1, x2, y2, car_id).
+
+    Returns:
+        tuple: 번호판별 차량 좌표와 ID 배열 (N, 5) (배정되지 않은 번호판은 -1)과
+               배정되지 않은 번호판의 인덱스 배열.
+    """
+    assignments = np.full((len(license_plates), 5), -1.0)
+    if len(license_plates) == 0 or len(vehicle_track_ids) == 0:
+        return assignments, np.arange(len(license_plates))
+
+    plates = np.array([license_plate[:4] for license_plate in license_plates], dtype=float)
+    tracks = np.asarray(vehicle_track_ids, dtype=float).reshape(-1, 5)
+
+    p = plates[:, None, :]
+    t = tracks[None, :, :4]
+    inside = (p[..., 0] > t[..., 0]) & (p[..., 1] > t[..., 1]) & (p[..., 2] < t[..., 2]) & (p[..., 3] < t[..., 3])
+    areas = (tracks[:, 2] - tracks[:, 0]) * (tracks[:, 3] - tracks[:, 1])
+    best = np.where(inside, areas[None, :], np.inf).argmin(axis=1)
 
-    for j, (xcar1, ycar1, xcar2, ycar2, car_id) in enumerate(vehicle_track_ids):
-        if x1 > xcar1 and y1 > ycar1 and x2 < xcar2 and y2 < ycar2:
-            return xcar1, ycar1, xcar2, ycar2, car_id
+    assigned = inside.any(axis=1)
+    assignments[assigned] = tracks[best[assigned]]
+    return assignments, np.flatnonzero(~assigned)
 
-    return -1, -1, -1, -1, -1
+
+def box_iou(boxes_a, boxes_b):
+    """
+    두 박스 집합의 모든 쌍에 대한 IoU를 계산합니다.
+
+    Args:
+        boxes_a (array-like): 박스 좌표 배열 (N, 4+) (x1, y1, x2, y2, ...).
+        boxes_b (array-like): 박스 좌표 배열 (M, 4+).
+
+    Returns:
+        numpy.ndarray: IoU 행렬 (N, M).
+    """
+    a = np.asarray(boxes_a, dtype=float)
+    b = np.asarray(boxes_b, dtype=float)
+    a = (a[:, :4] if a.size else np.zeros((0, 4)))[:, None, :]
+    b = (b[:, :4] if b.size else np.zeros((0, 4)))[None, :, :]
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def letterbox(image, size, color=(114, 114, 114)):
+    """
+    이미지의 비율을 유지한 채 size x size 크기로 맞추고 남는 영역을 채웁니다.
+
+    Args:
+        image (numpy.ndarray): 입력 이미지.
+        size (int): 출력 이미지의 한 변 길이.
+        color (tuple): 여백 색상.
+
+    Returns:
+        tuple: 레터박스 이미지, 배율, (x 여백, y 여백).
+               원본 좌표는 (좌표 - 여백) / 배율 로 복원됩니다.
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+    pad_x = (size - new_w) // 2
+    pad_y = (size - new_h) // 2
+    boxed = cv2.copyMakeBorder(resized, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+                               cv2.BORDER_CONSTANT, value=color)
+    return boxed, scale, (pad_x, pad_y)
+
+
+def crop_sharpness(crop):
+    """
+    번호판 이미지의 선명도(라플라시안 분산)를 계산합니다.
+
+    Args:
+        crop (numpy.ndarray): 번호판 이미지.
+
+    Returns:
+        float: 값이 클수록 선명한 이미지.
+    """
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(crop, cv2.CV_64F).var()
+
+
+class OcrScheduler:
+    """
+    차량(car_id)별로 OCR 실행 여부를 결정하고 인식 결과를 재사용합니다.
+
+    번호판 이미지가 이전보다 min_gain 배 이상 선명하거나 클 때만 OCR을 실행합니다.
+    인식 결과는 PlateConsensus 의 글자 위치별 투표로 합치며, 유효한 결과가 min_agree 번
+    모이고 합의 신뢰도가 min_share 이상이면(또는 max_reads 번 읽으면) 더 이상 읽지
+    않습니다. OCR을 건너뛴 프레임에는 지금까지의 합의 결과를 사용합니다.
+
+    Args:
+        min_agree (int): 결과를 확정하는 데 필요한 유효한 인식 횟수.
+        min_gain (float): OCR을 다시 실행하기 위한 선명도/크기 증가 배율.
+        max_reads (int): 차량 하나당 최대 OCR 횟수.
+        min_share (float): 결과를 확정하는 데 필요한 위치별 득표 비율의 평균.
+    """
+
+    def __init__(self, min_agree=3, min_gain=1.05, max_reads=10, min_share=0.9):
+        self.min_agree = min_agree
+        self.min_gain = min_gain
+        self.max_reads = max_reads
+        self.min_share = min_share
+        self.tracks = {}
+        self.consensus = PlateConsensus()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def __getstate__(self):
+        # 잠금과 아직 끝나지 않은 OCR 작업은 저장하지 않습니다 (체크포인트용).
+        # OCR 워커가 결과를 더하는 중에 저장하지 않도록 잠금 안에서 복사합니다.
+        with self._lock:
+            state = {key: value for key, value in self.__dict__.items() if key not in ('_lock', '_idle')}
+            state['tracks'] = {car_id: copy.deepcopy(dict(track, pending=[]))
+                               for car_id, track in self.tracks.items()}
+            state['consensus'] = copy.deepcopy(self.consensus)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _track(self, car_id):
+        if car_id not in self.tracks:
+            self.tracks[car_id] = {'sharpness': 0, 'area': 0, 'reads': 0, 'valid_reads': 0, 'accepted': False,
+                                   'pending': []}
+        return self.tracks[car_id]
+
+    def should_read(self, car_id, crop):
+        """
+        번호판 이미지에 OCR을 실행해야 하는지 확인합니다.
+
+        Args:
+            car_id (int): 차량 ID.
+            crop (numpy.ndarray): 번호판 이미지.
+
+        Returns:
+            bool: OCR을 실행해야 하면 True.
+        """
+        with self._lock:
+            track = self._track(car_id)
+            if track['accepted'] or track['reads'] >= self.max_reads:
+                return False
+
+            sharpness = crop_sharpness(crop)
+            area = crop.shape[0] * crop.shape[1]
+            if track['reads'] and sharpness < track['sharpness'] * self.min_gain and \
+               area < track['area'] * self.min_gain:
+                return False
+
+            track['sharpness'] = max(track['sharpness'], sharpness)
+            track['area'] = max(track['area'], area)
+            track['reads'] += 1
+            return True
+
+    def add_reading(self, car_id, text, score, bbox_score=1.0):
+        """
+        OCR 결과를 합의 투표에 추가합니다. 'Unknown' 이나 형식에 맞지 않는 결과는 무시됩니다.
+
+        Args:
+            car_id (int): 차량 ID.
+            text (str): 번호판 텍스트.
+            score (float): 신뢰도 점수.
+            bbox_score (float): 번호판 검출 신뢰도 점수.
+        """
+        if not isinstance(text, str) or not license_complies_format(text):
+            return
+        with self._lock:
+            track = self._track(car_id)
+            _, share = self.consensus.add(car_id, text, score, bbox_score)
+            track['valid_reads'] += 1
+            if track['valid_reads'] >= self.min_agree and share >= self.min_share:
+                track['accepted'] = True
+
+    def add_pending(self, car_id, future, bbox_score=1.0):
+        """
+        백그라운드에서 실행 중인 OCR 결과(future)를 등록합니다.
+        """
+        with self._lock:
+            self._track(car_id)['pending'].append(future)
+        future.add_done_callback(lambda f: self._finish(car_id, f, bbox_score))
+
+    def _finish(self, car_id, future, bbox_score):
+        self.add_reading(car_id, *future.result(), bbox_score)
+        with self._lock:
+            self.tracks[car_id]['pending'].remove(future)
+            self._idle.notify_all()
+
+    def wait_idle(self):
+        """
+        실행 중인 OCR 결과가 모두 반영될 때까지 기다립니다 (체크포인트 저장 전).
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: not any(track['pending'] for track in self.tracks.values()))
+
+    def result(self, car_id):
+        """
+        차량의 현재 번호판 텍스트와 신뢰도 점수를 반환합니다.
+
+        Returns:
+            tuple: 합의 텍스트와 신뢰도 점수 (PlateConsensus.best 참고).
+                   인식된 텍스트가 없으면 ('Unknown', 0).
+        """
+        with self._lock:
+            return self.consensus.best(car_id)
+
+    def result_future(self, car_id):
+        """
+        현재 실행 중인 OCR이 모두 끝난 뒤의 결과를 담는 future를 반환합니다.
+        """
+        future = Future()
+        with self._lock:
+            pending = list(self._track(car_id)['pending'])
+        if not pending:
+            future.set_result(self.result(car_id))
+            return future
+
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            future.set_result(self.result(car_id))
+
+        for pending_future in pending:
+            pending_future.add_done_callback(done)
+        return future
+
+
+class PlateConsensus:
+    """
+    차량(car_id)별로 여러 프레임의 번호판 인식 결과를 글자 위치별 투표로 합칩니다.
+
+    각 인식 결과는 text_score * bbox_score 가중치로 번호판 길이별, 글자 위치별
+    히스토그램에 더해지고, 가장 가중치가 큰 길이와 글자로 최종 텍스트를 만듭니다.
+    투표는 누적되기만 하므로 최선 결과를 바로 갱신할 수 있어, 인식 결과 하나를
+    추가하는 비용은 번호판 길이(최대 8)에만 비례합니다.
+    """
+
+    def __init__(self):
+        self.tracks = {}
+
+    def add(self, car_id, text, text_score, bbox_score=1.0):
+        """
+        인식 결과를 추가하고 해당 차량의 현재 최선 결과를 반환합니다.
+
+        Args:
+            car_id (int): 차량 ID.
+            text (str): 번호판 텍스트. 'Unknown' 이나 형식에 맞지 않는 텍스트는 무시됩니다.
+            text_score (float): OCR 신뢰도 점수.
+            bbox_score (float): 번호판 검출 신뢰도 점수.
+
+        Returns:
+            tuple: 번호판 텍스트와 신뢰도 점수 (add 참고).
+        """
+        if not isinstance(text, str) or not license_complies_format(text):
+            return self.best(car_id)
+
+        weight = float(text_score) * float(bbox_score)
+        track = self.tracks.setdefault(car_id, {'lengths': {}, 'best_length': None, 'text': None, 'score': 0})
+        length = track['lengths'].setdefault(len(text), {'weight': 0, 'positions': [
+            {'votes': {}, 'total': 0, 'best': None} for _ in text]})
+        length['weight'] += weight
+
+        for char, position in zip(text, length['positions']):
+            position['votes'][char] = position['votes'].get(char, 0) + weight
+            position['total'] += weight
+            if position['best'] is None or position['votes'][char] > position['votes'][position['best']]:
+                position['best'] = char
+
+        if track['best_length'] is None or length['weight'] > track['lengths'][track['best_length']]['weight']:
+            track['best_length'] = len(text)
+
+        # 위치별로 이긴 글자의 득표 비율 평균을 신뢰도로 사용
+        positions = track['lengths'][track['best_length']]['positions']
+        track['text'] = ''.join(position['best'] for position in positions)
+        track['score'] = sum(position['votes'][position['best']] / position['total'] if position['total'] else 0
+                             for position in positions) / len(positions)
+        return track['text'], track['score']
+
+    def best(self, car_id):
+        """
+        차량의 현재 최선 번호판 텍스트와 신뢰도 점수를 반환합니다.
+
+        Returns:
+            tuple: 번호판 텍스트와 0~1 사이의 신뢰도 점수(위치별 득표 비율의 평균).
+                   인식 결과가 없으면 ('Unknown', 0).
+        """
+        track = self.tracks.get(car_id)
+        if track is None or track['text'] is None:
+            return 'Unknown', 0
+        return track['text'], track['score']
+
+
+class MotionGate:
+    """
+    축소한 프레임의 차이로 장면의 움직임을 측정해 추론할 프레임을 고릅니다.
+
+    마지막으로 추론한 프레임과 비교해 pixel_threshold 이상 바뀐 픽셀의 비율이
+    min_changed 를 넘으면 바로 추론하고, 움직임이 없으면 max_stride 프레임에
+    한 번만 추론합니다. 느린 움직임도 누적되어 결국 감지됩니다.
+
+    Args:
+        max_stride (int): 움직임이 없을 때 추론하는 프레임 간격.
+        min_changed (float): 움직임으로 판단하는 바뀐 픽셀의 비율.
+        pixel_threshold (int): 픽셀이 바뀌었다고 판단하는 밝기 차이.
+        width (int): 비교에 사용하는 축소 프레임의 너비.
+    """
+
+    def __init__(self, max_stride=10, min_changed=0.001, pixel_threshold=25, width=160):
+        self.max_stride = max_stride
+        self.min_changed = min_changed
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self._reference = None
+        self._since = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+
+    def changed_fraction(self, thumbnail):
+        """
+        기준 프레임과 비교해 바뀐 픽셀의 비율을 계산합니다.
+        """
+        return np.count_nonzero(cv2.absdiff(thumbnail, self._reference) > self.pixel_threshold) / thumbnail.size
+
+    def should_process(self, frame):
+        """
+        이 프레임을 추론해야 하는지 반환합니다.
+
+        Args:
+            frame (numpy.ndarray): 디코딩된 프레임.
+
+        Returns:
+            bool: 움직임이 있거나 max_stride 에 도달하면 True.
+        """
+        thumbnail = self._thumbnail(frame)
+        if (self._reference is None or self._since + 1 >= self.max_stride
+                or self.changed_fraction(thumbnail) > self.min_changed):
+            self._reference = thumbnail
+            self._since = 0
+            return True
+        self._since += 1
+        return False
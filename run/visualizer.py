@@ -1,8 +1,15 @@
 
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
-import pandas as pd
-import ast
+from util import PlateConsensus, PLATE_BBOX_COLUMNS
+from data_processor import load_results
+from timing import timer
 
 def draw_border(img, top_left, bottom_right, color=(0, 255, 0), thickness=10, line_length_x=200, line_length_y=200):
     x1, y1 = top_left
@@ -19,13 +26,301 @@ def draw_border(img, top_left, bottom_right, color=(0, 255, 0), thickness=10, li
 
     return img
 
-def generate_video(input_csv_path, video_path, output_video_path):
+def draw_license_plate(frame, bbox, license_crop, license_plate_number):
+    """
+    Draws a license plate box with its enlarged crop and text above it.
+    """
+    x1, y1, x2, y2 = bbox
+    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 12)
+
+    H, W, _ = license_crop.shape
+    try:
+        frame[int(y1) - H - 100:int(y1) - 100, int((x2 + x1 - W) / 2):int((x2 + x1 + W) / 2)] = license_crop
+        frame[int(y1) - H - 400:int(y1) - H - 100, int((x2 + x1 - W) / 2):int((x2 + x1 + W) / 2)] = (255, 255, 255)
+        (text_width, text_height), _ = cv2.getTextSize(license_plate_number, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+        cv2.putText(frame, license_plate_number,
+                    (int((x2 + x1 - text_width) / 2), int(y1 - H - 250 + (text_height / 2))),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    except Exception as e:
+        pass
+
+    return frame
+
+def update_license_crop(license_plate, car_id, frame, bbox, license_plate_number, score):
+    """
+    Keeps the plate crop of the best-scoring row seen so far for a car.
+
+    Rows with an equal score replace the stored crop, so the latest one wins.
+    """
+    if score is None or np.isnan(score):
+        score = 0
+    if car_id in license_plate and score < license_plate[car_id]['score']:
+        return
+
+    x1, y1, x2, y2 = bbox
+    license_crop = frame[int(y1):int(y2), int(x1):int(x2), :]
+    if license_crop.size == 0:
+        return
+
+    license_plate[car_id] = {
+        'license_crop': cv2.resize(license_crop, (200, 100)),
+        'license_plate_number': license_plate_number,
+        'score': score
+    }
+
+def build_overlay_index(results):
+    """
+    Builds a frame-indexed overlay table from the results.
+
+    Rows are sorted by frame once and kept in flat arrays with integer plate
+    boxes; the overlays of frame n are rows offsets[n]:offsets[n + 1]. Rows
+    without a plate box are dropped.
+    """
+    results = results[results[PLATE_BBOX_COLUMNS].notna().all(axis=1)]
+    frames = results['frame_nmr'].to_numpy()
+    order = np.argsort(frames, kind='stable')
+    frames = frames[order]
+    frame_count = int(frames[-1]) + 1 if len(frames) else 0
+
+    return {
+        'offsets': np.searchsorted(frames, np.arange(frame_count + 1)),
+        'car_ids': results['car_id'].to_numpy()[order].tolist(),
+        'bboxes': results[PLATE_BBOX_COLUMNS].to_numpy()[order].astype(int),
+        'texts': results['license_number'].to_numpy()[order].tolist(),
+        'scores': results['license_number_score'].fillna(0).to_numpy()[order].tolist()
+    }
+
+def plate_texts_by_car(results):
+    """
+    Returns the consensus plate text of every car in the results.
+
+    The plate text per car only depends on the results, not on the pixels.
+    """
+    consensus = PlateConsensus()
+    for car_id, text, text_score, bbox_score in zip(results['car_id'], results['license_number'],
+                                                    results['license_number_score'],
+                                                    results['license_plate_bbox_score']):
+        consensus.add(car_id, text, text_score, bbox_score)
+    return {car_id: consensus.best(car_id)[0] for car_id in consensus.tracks}
+
+def render_frames(cap, out, overlays, plate_texts, license_plate, frame_nmr=0, end_frame=None):
+    """
+    Reads frames from cap, draws their overlays and writes them to out.
+
+    Starts at frame_nmr (cap must already be positioned there) and stops before
+    end_frame, or at the end of the video if end_frame is None. license_plate
+    holds the best crop per car and is updated as frames are read.
+    """
+    offsets = overlays['offsets']
+
+    while end_frame is None or frame_nmr < end_frame:
+        start_time = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            print(f"End of video or error at frame {frame_nmr}.")
+            break
+
+        if frame_nmr + 1 < len(offsets):
+            start, end = offsets[frame_nmr], offsets[frame_nmr + 1]
+        else:
+            start, end = 0, 0
+        car_ids = overlays['car_ids'][start:end]
+        bboxes = overlays['bboxes'][start:end].tolist()
+
+        # Update the crops from the clean frame before anything is drawn on it
+        for car_id, bbox, text, score in zip(car_ids, bboxes, overlays['texts'][start:end], overlays['scores'][start:end]):
+            try:
+                update_license_crop(license_plate, car_id, frame, bbox, text, score)
+            except Exception as e:
+                print(f"Error processing car_id {car_id}: {e}")
+
+        for car_id, bbox in zip(car_ids, bboxes):
+            try:
+                license_plate_number = plate_texts.get(car_id, 'Unknown')
+                if license_plate_number == 'Unknown':
+                    license_plate_number = license_plate[car_id]['license_plate_number']
+                draw_license_plate(frame, bbox, license_plate[car_id]['license_crop'], license_plate_number)
+            except Exception as e:
+                pass
+
+        out.write(frame)
+        timer.record('render', time.perf_counter() - start_time)
+        frame_nmr += 1
+
+    return frame_nmr
+
+def select_crop_rows(overlays, frame_nmr, width, height):
+    """
+    Returns, per car, the overlay row whose crop render_frames holds on reaching frame_nmr.
+
+    This replays the update_license_crop rule on the boxes and scores alone, so
+    a segment renderer can fetch just those crops instead of decoding every
+    earlier frame.
+    """
+    offsets = overlays['offsets']
+    rows = offsets[min(frame_nmr, len(offsets) - 1)] if len(offsets) else 0
+    best_scores = {}
+    crop_rows = {}
+    for row in range(rows):
+        car_id = overlays['car_ids'][row]
+        score = overlays['scores'][row]
+        if car_id in best_scores and score < best_scores[car_id]:
+            continue
+        x1, y1, x2, y2 = overlays['bboxes'][row].tolist()
+        if not len(range(height)[y1:y2]) or not len(range(width)[x1:x2]):
+            continue
+        best_scores[car_id] = score
+        crop_rows[car_id] = row
+    return crop_rows
+
+def render_segment(input_csv_path, video_path, segment_path, start_frame, end_frame, fourcc='mp4v'):
+    """
+    Renders frames [start_frame, end_frame) of the video into segment_path, encoded with fourcc.
+
+    The crops held at start_frame are fetched with one seek per source frame,
+    so the segment is identical to the same frames of a single-process render.
+
+    Returns the stage timings of the worker (see timing.StageTimer.snapshot).
+    """
+    timer.reset()
+    results = load_results(input_csv_path)
+    plate_texts = plate_texts_by_car(results)
+    overlays = build_overlay_index(results)
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    # Only cars that appear in this segment need their earlier crop
+    offsets = overlays['offsets']
+    first_row = offsets[min(start_frame, len(offsets) - 1)] if len(offsets) else 0
+    last_row = offsets[-1] if end_frame is None or not len(offsets) else offsets[min(end_frame, len(offsets) - 1)]
+    segment_cars = set(overlays['car_ids'][first_row:last_row])
+
+    crop_rows = select_crop_rows(overlays, start_frame, width, height)
+    rows_by_frame = {}
+    for car_id, row in crop_rows.items():
+        if car_id in segment_cars:
+            row_frame = int(np.searchsorted(offsets, row, side='right')) - 1
+            rows_by_frame.setdefault(row_frame, []).append(row)
+
+    license_plate = {}
+    for row_frame in sorted(rows_by_frame):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, row_frame)
+        ret, frame = cap.read()
+        if not ret:
+            print(f"Error reading frame {row_frame}.")
+            continue
+        for row in rows_by_frame[row_frame]:
+            update_license_crop(license_plate, overlays['car_ids'][row], frame, overlays['bboxes'][row].tolist(),
+                                overlays['texts'][row], overlays['scores'][row])
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    out = cv2.VideoWriter(segment_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    render_frames(cap, out, overlays, plate_texts, license_plate, start_frame, end_frame)
+    out.release()
+    cap.release()
+    return timer.snapshot()
+
+def find_keyframes(video_path):
+    """
+    Returns the frame numbers of the keyframes of a video, or None if ffprobe is unavailable.
+    """
+    try:
+        output = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=flags',
+                                 '-of', 'csv=p=0', video_path], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [i for i, flags in enumerate(output.split()) if 'K' in flags]
+
+def split_frame_ranges(frame_count, segments, keyframes=None):
+    """
+    Splits [0, frame_count) into at most segments ranges, starting on keyframes if known.
+
+    The last range is open-ended (None) so frames past an inexact frame count are kept.
+    """
+    starts = [frame_count * i // segments for i in range(segments)]
+    if keyframes:
+        starts = [max([k for k in keyframes if k <= start] or [0]) for start in starts]
+    starts = sorted(set(starts))
+    return list(zip(starts, starts[1:] + [None]))
+
+def segment_format():
+    """
+    Returns the (extension, fourcc) to render segments with, or None if segments cannot be joined
+    without encoding the video twice.
+
+    With ffmpeg the segments are encoded once as mp4v and joined by stream copy.
+    Without it they are written losslessly (FFV1) and encoded once while joining.
+    """
+    if shutil.which('ffmpeg'):
+        return '.mp4', 'mp4v'
+    probe_path = os.path.join(tempfile.gettempdir(), f"segment_probe_{os.getpid()}.avi")
+    out = cv2.VideoWriter(probe_path, cv2.VideoWriter_fourcc(*'FFV1'), 30, (16, 16))
+    available = out.isOpened()
+    out.release()
+    if os.path.exists(probe_path):
+        os.remove(probe_path)
+    return ('.avi', 'FFV1') if available else None
+
+def concatenate_segments(segment_paths, output_video_path):
+    """
+    Joins rendered segments into one mp4v video. Returns False if joining failed.
+
+    mp4v segments are joined by ffmpeg without re-encoding; lossless segments
+    (see segment_format) are encoded here, for the first and only time.
+    """
+    if segment_paths[0].endswith('.mp4'):
+        list_path = output_video_path + '.segments.txt'
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for segment_path in segment_paths:
+                f.write(f"file '{os.path.abspath(segment_path)}'\n")
+        try:
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                            '-c', 'copy', output_video_path], check=True)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Error concatenating with ffmpeg: {e}")
+            return False
+        finally:
+            os.remove(list_path)
+
+    out = None
+    for segment_path in segment_paths:
+        cap = cv2.VideoCapture(segment_path)
+        if out is None:
+            out = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*'mp4v'), cap.get(cv2.CAP_PROP_FPS),
+                                  (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))))
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    if out is not None:
+        out.release()
+    return True
+
+def generate_video(input_csv_path, video_path, output_video_path, workers=1):
     """
     Generates a video with license plate detections visualized.
+
+    input_csv_path may be a CSV or a columnar .npz results file. The plate
+    text shown for each car is the per-character consensus of all
+    of its readings (see util.PlateConsensus).
+
+    The video is read once, front to back. The plate crop shown for a car is
+    the best one seen so far (see update_license_crop), so no seeking is needed.
+
+    With workers > 1 the video is split into keyframe-aligned frame ranges that
+    are rendered by a process pool (see render_segment) and concatenated. The
+    output is encoded only once (see segment_format); if that is not possible,
+    or joining fails, the video is rendered in this process instead.
     """
     try:
-        results = pd.read_csv(input_csv_path)
-        print("CSV file loaded successfully.")
+        results = load_results(input_csv_path)
+        print("Results file loaded successfully.")
     except Exception as e:
         print(f"Error loading CSV: {e}")
         return
@@ -39,63 +334,36 @@ def generate_video(input_csv_path, video_path, output_video_path):
         print(f"Error loading video: {e}")
         return
 
+    fmt = segment_format() if workers > 1 else None
+    if workers > 1 and fmt is None:
+        print("Neither ffmpeg nor a lossless segment codec is available; rendering in a single process")
+    if fmt is not None:
+        ext, fourcc = fmt
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        ranges = split_frame_ranges(frame_count, workers, find_keyframes(video_path))
+        segment_paths = [f"{output_video_path}.part{i:03d}{ext}" for i in range(len(ranges))]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for snapshot in executor.map(render_segment, [input_csv_path] * len(ranges),
+                                         [video_path] * len(ranges), segment_paths,
+                                         [start for start, _ in ranges], [end for _, end in ranges],
+                                         [fourcc] * len(ranges)):
+                timer.merge(snapshot)
+        joined = concatenate_segments(segment_paths, output_video_path)
+        for segment_path in segment_paths:
+            os.remove(segment_path)
+        if joined:
+            cap.release()
+            print(f"Processing complete. Video saved to {output_video_path}.")
+            return
+        print("Rendering in a single process instead")
+
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
 
-    license_plate = {}
-    for car_id in np.unique(results['car_id']):
-        car_results = results[results['car_id'] == car_id]
-        for _, row in car_results.iterrows():
-            try:
-                x1, y1, x2, y2 = ast.literal_eval(row['license_plate_bbox'])
-                license_plate_number = row['license_number']
-                cap.set(cv2.CAP_PROP_POS_FRAMES, row['frame_nmr'])
-                ret, frame = cap.read()
-                if ret:
-                    license_crop = frame[int(y1):int(y2), int(x1):int(x2), :]
-                    license_crop = cv2.resize(license_crop, (200, 100))
-                    license_plate[car_id] = {'license_crop': license_crop, 'license_plate_number': license_plate_number}
-                else:
-                    print(f"Error reading frame {row['frame_nmr']} for car_id {car_id}.")
-            except Exception as e:
-                print(f"Error processing car_id {car_id}: {e}")
-
-    frame_nmr = 0
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print(f"End of video or error at frame {frame_nmr}.")
-            break
-
-        df_ = results[results['frame_nmr'] == frame_nmr]
-        for _, row in df_.iterrows():
-            try:
-                x1, y1, x2, y2 = ast.literal_eval(row['license_plate_bbox'])
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 12)
-
-                license_crop = license_plate[row['car_id']]['license_crop']
-                license_plate_number = license_plate[row['car_id']]['license_plate_number']
-
-                H, W, _ = license_crop.shape
-                try:
-                    frame[int(y1) - H - 100:int(y1) - 100, int((x2 + x1 - W) / 2):int((x2 + x1 + W) / 2)] = license_crop
-                    frame[int(y1) - H - 400:int(y1) - H - 100, int((x2 + x1 - W) / 2):int((x2 + x1 + W) / 2)] = (255, 255, 255)
-                    (text_width, text_height), _ = cv2.getTextSize(license_plate_number, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
-                    cv2.putText(frame, license_plate_number,
-                                (int((x2 + x1 - text_width) / 2), int(y1 - H - 250 + (text_height / 2))),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
-                except Exception as e:
-                    pass
-            except Exception as e:
-                pass
-
-        out.write(frame)
-        frame_nmr += 1
+    render_frames(cap, out, build_overlay_index(results), plate_texts_by_car(results), {})
 
     out.release()
     cap.release()
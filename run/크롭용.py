@@ -23,6 +23,9 @@ cap = cv2.VideoCapture('./demo5.mp4')
 
 vehicles = [2, 3, 5, 7]
 
+# Show every Nth frame in a preview window (0 runs headless)
+PREVIEW_EVERY = 1
+
 # Read frames
 frame_nmr = -1
 ret = True
@@ -30,9 +33,6 @@ while ret:
     frame_nmr += 1
     ret, frame = cap.read()
     if ret:
-        # 원본 프레임 복사 (크롭 이미지 저장에 사용)
-        original_frame = frame.copy()
-        
         results[frame_nmr] = {}
         # Detect vehicles
         detections = coco_model(frame)[0]
@@ -43,7 +43,7 @@ while ret:
                 detections_.append([x1, y1, x2, y2, score])
 
                 # Crop the vehicle image from the original frame
-                vehicle_crop = original_frame[int(y1):int(y2), int(x1):int(x2)]
+                vehicle_crop = frame[int(y1):int(y2), int(x1):int(x2)]
 
                 # Save the cropped vehicle image
                 vehicle_image_path = os.path.join(
@@ -64,7 +64,7 @@ while ret:
 
             if car_id != -1:
                 # Crop license plate
-                license_plate_crop = original_frame[int(y1):int(y2), int(x1): int(x2), :]
+                license_plate_crop = frame[int(y1):int(y2), int(x1): int(x2), :]
 
                 # Process license plate
                 license_plate_crop_gray = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
@@ -84,16 +84,18 @@ while ret:
                         }
                     }
 
-        # Show the frame with bounding boxes for debugging (optional)
-        cv2.imshow('Vehicle and License Plate Detection', frame)
+        # Show the frame for debugging (optional)
+        if PREVIEW_EVERY and frame_nmr % PREVIEW_EVERY == 0:
+            cv2.imshow('Vehicle and License Plate Detection', frame)
 
-        # Break on 'q' key press
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            # Break on 'q' key press
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
 # Release video and destroy windows
 cap.release()
-cv2.destroyAllWindows()
+if PREVIEW_EVERY:
+    cv2.destroyAllWindows()
 
 # Write results
 write_csv(results, './test.csv')